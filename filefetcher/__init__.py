@@ -16,8 +16,6 @@ Pull daily GPS files
 """
 
 
-import tomputils.util as tutil
 from filefetcher.version import __version__
 
-logger = tutil.setup_logging("filefetcher - errors")
 __all__ = ["__version__"]
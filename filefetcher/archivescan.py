@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Take an in-memory snapshot of the archive.
+
+The archive is usually on NFS, where every stat is a round trip. scan() walks
+each root once, listing directories in parallel, and records the path and
+mtime of every file so later questions about the archive can be answered
+without touching it again.
+"""
+
+import logging
+import os
+import threading
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_WORKERS = 8
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    def __init__(self, mtimes):
+        self.mtimes = mtimes
+        self.paths = None
+        self.lock = threading.Lock()
+
+    def exists(self, path):
+        return os.path.normpath(path) in self.mtimes
+
+    def sorted_paths(self):
+        """Every path, sorted so those below a directory are adjacent."""
+        with self.lock:
+            if self.paths is None:
+                self.paths = sorted(self.mtimes)
+            return self.paths
+
+    def new_files(self, dir, since=0):
+        """Files below dir modified after since, a POSIX timestamp."""
+        prefix = os.path.join(os.path.normpath(dir), "")
+        # Paths starting with prefix sort between it and prefix with its
+        # final separator bumped to the next character.
+        paths = self.sorted_paths()
+        start = bisect_left(paths, prefix)
+        end = bisect_left(paths, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        return [path for path in paths[start:end] if self.mtimes[path] > since]
+
+    def recent(self, since):
+        """A smaller snapshot holding only files modified after since."""
+        return Snapshot(
+            {path: mtime for path, mtime in self.mtimes.items() if mtime > since}
+        )
+
+
+def _scan_dir(dir):
+    files = []
+    dirs = []
+    try:
+        with os.scandir(dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    dirs.append(entry.path)
+                elif entry.is_file():
+                    files.append((entry.path, entry.stat().st_mtime))
+    except FileNotFoundError:
+        logger.debug("%s does not exist", dir)
+    return files, dirs
+
+
+def scan(roots, workers=DEFAULT_WORKERS):
+    """Walk each root once and return a Snapshot of everything below them.
+
+    Symlinked directories are followed, except to a directory which is
+    already being walked further up the same path, which would loop forever.
+    """
+    mtimes = {}
+    parents = {}
+
+    def submit(dir, above):
+        real_dir = os.path.realpath(dir)
+        if real_dir in above:
+            logger.info("Not following %s, it loops back to %s", dir, real_dir)
+            return
+        future = pool.submit(_scan_dir, dir)
+        parents[future] = above | {real_dir}
+        pending.add(future)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for root in roots:
+            submit(os.path.normpath(root), frozenset())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                mtimes.update(files)
+                above = parents.pop(future)
+                for dir in dirs:
+                    submit(dir, above)
+
+    logger.info("Found %d files below %d directories", len(mtimes), len(roots))
+    logger.debug("Scanned %s", ", ".join(sorted(roots)))
+    return Snapshot(mtimes)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Find archived files which don't match the datalogger's copy.
+
+An interrupted transfer can leave a short file in the archive, and filefetcher
+won't fetch a file it already has. For each datalogger, the remote sizes of
+recent files are found using one listing per remote directory, the archived
+copies are checked on a pool of threads, and files whose sizes differ are
+logged. With --requeue they are fetched again: a short file resumes from where
+it stopped if the datalogger allows partial downloads, anything else is
+fetched from scratch and replaces the archived copy once it arrives.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import tomputils.util as tutil
+from single import Lock
+
+import filefetcher.filefetcher as ff
+from filefetcher import period
+from filefetcher.transport import TransportError
+
+DEFAULT_DAYS = 30
+DEFAULT_WORKERS = 8
+
+
+def arg_parse():
+    description = "I compare archived files with those on the dataloggers."
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "-d",
+        "--days",
+        help="How many days back should I look?",
+        type=int,
+        default=DEFAULT_DAYS,
+    )
+    parser.add_argument(
+        "-r",
+        "--requeue",
+        help="Fetch files which don't match again.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="How many archived files should I check at once?",
+        type=int,
+        default=DEFAULT_WORKERS,
+    )
+    return parser.parse_args()
+
+
+def local_size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+
+
+def audit_logger(datalogger, days, pool):
+    """Archived files whose size doesn't match the remote file.
+
+    Returns a list of (url, out_path, local size, remote size).
+    """
+    step = period.get_period(datalogger)
+    last = period.last_complete(datalogger)
+    count = days * period.per_day(datalogger)
+    urls = []
+    out_paths = []
+    for i in range(count):
+        when = last - i * step
+        url = period.expand(datalogger, "url", when)
+        urls.append(url)
+        out_paths.append(ff.find_out_file(datalogger, when, url))
+
+    remote = ff.transport.sizes(datalogger, urls)
+    checked = [(url, out) for url, out in zip(urls, out_paths) if url in remote]
+    local = pool.map(local_size, [out for url, out in checked])
+
+    mismatches = []
+    missing = 0
+    for (url, out_path), size in zip(checked, local):
+        if size is None:
+            missing += 1
+        elif size != remote[url]:
+            mismatches.append((url, out_path, size, remote[url]))
+
+    logger.info(
+        "%s: %d remote files, %d not archived, %d mismatched",
+        datalogger["name"],
+        len(remote),
+        missing,
+        len(mismatches),
+    )
+    return mismatches
+
+
+def requeue(datalogger, url, out_path, local, remote):
+    resume = ff.resume_downloads(datalogger) and local < remote
+    if resume:
+        # Resume from a copy so the archived file survives a failed transfer.
+        logger.info("Resuming %s from byte %d", out_path, local)
+        shutil.copyfile(out_path, ff.temp_path(out_path))
+    else:
+        # The archived copy is only replaced once the new one has arrived.
+        logger.info("Fetching %s again", out_path)
+
+    ff.fetch_file(datalogger, url, out_path, resume)
+
+
+def requeue_all(queue, mismatches):
+    """Fetch mismatched files again, holding the queue's lock."""
+    lock = Lock(ff.lock_path(queue))
+    gotlock, pid = lock.lock_pid()
+    if not gotlock:
+        logger.info("Queue %s locked, not requeuing its files", queue["name"])
+        return
+
+    if any("on_fetched" in datalogger for datalogger, *rest in mismatches):
+        from filefetcher.hooks import HookRunner
+
+        ff.hooks = HookRunner(
+            workers=ff.global_config.get("hookWorkers", 2),
+            depth=ff.global_config.get("hookQueueDepth", 32),
+        )
+    ff.fetch_history = ff.open_fetch_history()
+    try:
+        for datalogger, url, out_path, local, remote in mismatches:
+            requeue(datalogger, url, out_path, local, remote)
+    finally:
+        if ff.hooks is not None:
+            ff.hooks.close()
+            ff.hooks = None
+        if ff.fetch_history is not None:
+            ff.fetch_history.close()
+            ff.fetch_history = None
+        try:
+            lock.unlock()
+        except AttributeError:
+            pass
+
+
+def audit_queue(queue, args, pool):
+    mismatches = []
+    for datalogger in queue["dataloggers"]:
+        if datalogger.get("disabled", False):
+            continue
+
+        try:
+            found = audit_logger(datalogger, args.days, pool)
+        except TransportError as e:
+            logger.error("Cannot list files for %s: %s", datalogger["name"], e)
+            continue
+
+        for url, out_path, local, remote in found:
+            logger.warning(
+                "%s is %d bytes, %s is %d bytes", out_path, local, url, remote
+            )
+            mismatches.append((datalogger, url, out_path, local, remote))
+
+    if args.requeue and mismatches:
+        requeue_all(queue, mismatches)
+
+
+def main():
+    global logger
+    logger = tutil.setup_logging("fetcheraudit errors")
+    ff.logger = logger
+    args = arg_parse()
+
+    try:
+        ff.global_config = ff.parse_config()
+    except KeyError:
+        msg = "Environment variable {} unset, exiting.".format(ff.CONFIG_FILE_ENV)
+        tutil.exit_with_error(msg)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for queue in ff.global_config["queues"]:
+            if queue.get("disabled", False):
+                logger.info("Queue %s is disabled, skiping it.", queue["name"])
+            else:
+                audit_queue(queue, args, pool)
+
+    logger.debug("That's all for now, bye.")
+    logging.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Compute archive coverage from per-logger presence bitmaps.
+
+A bitmap is a NumPy boolean array with one element per file period, oldest
+first, ending with the period just before end. Window totals come from a
+single cumulative sum and missing spans from run-length encoding, so once
+presence is known a report costs the same whatever its span.
+"""
+
+import os
+
+import numpy as np
+
+from filefetcher import period
+
+
+def build(config, exists, end, count):
+    """Bitmap of the count periods before end, using exists(path) to test."""
+    first = end - count * period.get_period(config)
+    present = np.zeros(count, dtype=bool)
+    refresh(config, exists, first, present, range(count))
+    return present
+
+
+def refresh(config, exists, first, present, indices):
+    """Test the periods at indices of a bitmap starting at first."""
+    step = period.get_period(config)
+    out_dir = config["out_dir"]
+    for i in indices:
+        out_path = period.expand(config, "out_path", first + int(i) * step)
+        present[i] = exists(os.path.join(out_dir, out_path))
+
+
+def window_counts(present, windows):
+    """Count files present in the most recent n periods for each named window.
+
+    windows maps a name to n.
+    """
+    totals = np.concatenate(([0], np.cumsum(present, dtype=np.int64)))
+    size = len(present)
+    counts = {}
+    for name, n in windows.items():
+        n = min(max(n, 0), size)
+        counts[name] = int(totals[size] - totals[size - n])
+    return counts
+
+
+def missing_spans(present, end, step, limit):
+    """[first, last] period starts of each gap in the last limit periods.
+
+    The most recent gap comes first.
+    """
+    limit = min(max(limit, 0), len(present))
+    recent = present[len(present) - limit:]
+    start = end - limit * step
+
+    gaps = np.concatenate(([0], ~recent, [0])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(gaps))
+    spans = [
+        [start + int(first) * step, start + int(last) * step]
+        for first, last in zip(edges[0::2], edges[1::2] - 1)
+    ]
+    spans.reverse()
+    return spans
@@ -10,21 +10,35 @@
 """ Email a report of daily file changes."""
 
 import argparse
+import csv
+import io
+import json
 import os
 import logging
 import pathlib
-import subprocess
-from string import Template
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
-from jinja2 import Template as jinjatmpl
+from html.parser import HTMLParser
 import tomputils.util as tutil
-import smtplib
 
+from filefetcher import archivescan, period
+from filefetcher.history import HISTORY_DB_ENV, CoverageHistory
+
+from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 REQ_VERSION = (3, 5)
 CONFIG_FILE_ENV = "FF_CONFIG"
+NEW_FILE_AGE = timedelta(days=1)
+WEEK = 7
+MONTH = 30
+YEAR = 365
+RECHECK_DAYS = 14
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_ITEMS = 50
+DEFAULT_MAX_SIZE = 2_000_000  # characters
 STYLE = {
     "h1": """
                 font-family:Arial, sans-serif;
@@ -123,120 +137,142 @@ STYLE = {
                 background-color:#FCFBE3;
          """,
 }
+history = None
+new_fetches = {}
+
 EMAIL_TEMPLATE = """
 <HTML>
+<head>
+<style>
+{% for name, css in style.items() %}
+  .{{ name }} { {{ css.split()|join(' ') }} }
+{% endfor %}
+</style>
+</head>
 
 <body>
 {% block body %}
-  <h1 style="{{ style.h1 }}">Summary</h1><br>
-  <table style="{{ style.table }}">
+  <h1 class="h1">Summary</h1><br>
+  <table class="table">
   <tr>
-    <th style="{{ style.header_cell }}">&nbsp;</th>
-    <th style="{{ style.header_cell }}">Retrieved<br>yesterday</th>
-    <th style="{{ style.header_cell }}">Weekly<br>coverage</th>
-    <th style="{{ style.header_cell }}">Monthly<br>coverage</th>
-    <th style="{{ style.header_cell }}">Yearly<br>coverage</th>
+    <th class="header_cell">&nbsp;</th>
+    <th class="header_cell">Retrieved<br>yesterday</th>
+    <th class="header_cell">Weekly<br>coverage</th>
+    <th class="header_cell">Monthly<br>coverage</th>
+    <th class="header_cell">Yearly<br>coverage</th>
     {% if ad_hoc > 0 %}
-        <th style="{{ style.header_cell }}">{{ ad_hoc }} day<br>coverage</th>
+    <th class="header_cell">{{ ad_hoc }} day<br>coverage</th>
     {% endif %}
   </tr>
   {% for queue in queues %}
     {% for datalogger in queue['dataloggers'] %}
       <tr>
-        <td style="{{ style.logger_name_cell }}">
-          {{ datalogger.name }}
-        </td>
-        <td style="{{ style.logger_data_cell }}">
-          {{ datalogger.new_files|length }}
-        </td>
-        <td style="{{ style.logger_data_cell }}">
-          {{ '%d' % datalogger.coverage.weekly }}%
-        </td>
-        <td style="{{ style.logger_data_cell }}">
-          {{ '%d' % datalogger.coverage.monthly }}%
-        </td>
-        <td style="{{ style.logger_data_cell }}">
-          {{ '%d' % datalogger.coverage.yearly }}%
-        </td>
+        <td class="logger_name_cell">{{ datalogger.name }}</td>
+        <td class="logger_data_cell">{{ datalogger.new_files|length }}</td>
+        {% set change = datalogger.coverage.weekly_change %}
+        <td class="logger_data_cell">{{ '%d' % datalogger.coverage.weekly }}%
+          {%- if change is not none %} ({{ '%+d' % change }}){% endif %}</td>
+        <td class="logger_data_cell">{{ '%d' % datalogger.coverage.monthly }}%</td>
+        <td class="logger_data_cell">{{ '%d' % datalogger.coverage.yearly }}%</td>
         {% if ad_hoc > 0 %}
-          <td style="{{ style.logger_data_cell }}">
-            {{ '%d' % datalogger.coverage.ad_hoc }}%
-          </td>
+        <td class="logger_data_cell">{{ '%d' % datalogger.coverage.ad_hoc }}%</td>
         {% endif %}
       </tr>
     {% endfor %}
     <tr>
-      <td style="{{ style.queue_name_cell }}">
-        {{ queue.name }}
-      </td>
-      <td style="{{ style.queue_data_cell }}">
-        {{ queue.daily_total }}
-      </td>
-      <td style="{{ style.queue_data_cell }}">
-        {{ '%d' % queue.weekly_coverage }}%
-      </td>
-      <td style="{{ style.queue_data_cell }}">
-        {{ '%d' % queue.monthly_coverage }}%
-      </td>
-      <td style="{{ style.queue_data_cell }}">
-        {{ '%d' % queue.yearly_coverage }}%
-      </td>
+      <td class="queue_name_cell">{{ queue.name }}</td>
+      <td class="queue_data_cell">{{ queue.daily_total }}</td>
+      <td class="queue_data_cell">{{ '%d' % queue.weekly_coverage }}%</td>
+      <td class="queue_data_cell">{{ '%d' % queue.monthly_coverage }}%</td>
+      <td class="queue_data_cell">{{ '%d' % queue.yearly_coverage }}%</td>
       {% if ad_hoc > 0 %}
-        <td style="{{ style.queue_data_cell }}">
-          {{ '%d' % queue.ad_hoc_coverage }}%
-        </td>
+      <td class="queue_data_cell">{{ '%d' % queue.ad_hoc_coverage }}%</td>
       {% endif %}
-
     </tr>
   {% endfor %}
   </table>
 
-  <hr style="{{ style.hr }}">
-  <h1 style="{{ style.h1 }}">Files retrieved yesterday<h1><br>
+  {% if not compact %}
+  <hr class="hr">
+  <h1 class="h1">Files retrieved yesterday</h1><br>
   {% for queue in queues %}
     {% for datalogger in queue['dataloggers'] %}
-      <h2 style="{{ style.h2 }}">{{ queue.name }} - {{ datalogger.name  }}</h2>
+      <h2 class="h2">{{ queue.name }} - {{ datalogger.name  }}</h2>
       <ul>
-      {% if datalogger.new_files %}
-        {% for file in datalogger.new_files %}
-          <li style="{{ style.li }}">{{ file }}</li>
-        {% endfor %}
+      {% for file in datalogger.new_files[:max_items] %}
+        <li class="li">{{ file }}</li>
       {% else %}
-          <li style="{{ style.li }}">No files retrieved yesterday.</li>
+        <li class="li">No files retrieved yesterday.</li>
+      {% endfor %}
+      {% if datalogger.new_files|length > max_items %}
+        <li class="li">and {{ datalogger.new_files|length - max_items }} more</li>
       {% endif %}
       </ul>
     {% endfor %}
   {% endfor %}
+  {% endif %}
 
-  <hr style="{{ style.hr }}">
-  <h1 style="{{ style.h1 }}">Recent missing files<h1><br>
+  <hr class="hr">
+  <h1 class="h1">Recent missing files</h1><br>
   {% for queue in queues %}
     {% for datalogger in queue['dataloggers'] %}
-      <h2 style="{{ style.h2 }}">
+      {% set missing = datalogger.coverage.missing %}
+      {% if missing or not compact %}
+      <h2 class="h2">
         {{ queue.name }} - {{ datalogger.name  }}
         {% if datalogger.backfill %}
           - backfill through {{ datalogger.backfill }}
         {% endif %}
       </h2>
       <ul>
-      {% if datalogger.coverage.missing %}
-        {% for span in datalogger.coverage.missing %}
-          {% if span[0] == span[1] %}
-            <li style="{{ style.li }}">{{ span[0] }}</li>
-          {% else %}
-            <li style="{{ style.li }}">{{ span[0] }} - {{ span[1] }}</li>
-          {% endif %}
-        {% endfor %}
+      {% for span in missing[:max_items] %}
+        {% if span[0] == span[1] %}
+        <li class="li">{{ span[0] }}</li>
+        {% else %}
+        <li class="li">{{ span[0] }} - {{ span[1] }}</li>
+        {% endif %}
       {% else %}
-          <li style="{{ style.li }}">No missing files</li>
+        <li class="li">No missing files</li>
+      {% endfor %}
+      {% if missing|length > max_items %}
+        <li class="li">and {{ missing|length - max_items }} more</li>
       {% endif %}
       </ul>
+      {% endif %}
     {% endfor %}
   {% endfor %}
 {% endblock %}
 </body>
 </HTML>
 """
+TRUNCATED = """
+<hr class="hr">
+<p>Report truncated at {} characters.</p>
+"""
+VOID_ELEMENTS = {"br", "hr", "img", "input", "link", "meta"}
+
+
+class OpenElements(HTMLParser):
+    """Keep track of which elements are open in HTML fed so far."""
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+        self.closed = set()
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        self.closed.add(tag)
+        if tag in self.stack:
+            while self.stack.pop() != tag:
+                pass
+
+    def in_tag(self):
+        """Does the HTML so far stop part way through a tag?"""
+        return bool(self.rawdata)
 
 
 def arg_parse():
@@ -251,70 +287,155 @@ def arg_parse():
         help="Who should I email?",
         default=tutil.get_env_var("REPORT_RECIPIENT"),
     )
+    parser.add_argument(
+        "-c",
+        "--compact",
+        help="Leave out file lists and loggers with no missing files.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-items",
+        help="How many files or missing spans should I list for each logger?",
+        type=int,
+        default=DEFAULT_MAX_ITEMS,
+    )
+    parser.add_argument(
+        "--max-size",
+        help="How many characters of HTML should I send at most?",
+        type=int,
+        default=DEFAULT_MAX_SIZE,
+    )
+    parser.add_argument(
+        "-a",
+        "--attach",
+        help="Attach a machine-readable report. May be given more than once.",
+        choices=ATTACHMENTS,
+        action="append",
+        default=[],
+    )
     return parser.parse_args()
 
 
 def get_new_files(config):
+    """Files retrieved for config since NEW_FILE_AGE ago.
+
+    With a coverage history these are the files filefetcher recorded,
+    otherwise recently modified files found in the archive.
+    """
+    if history is not None:
+        return new_fetches.get(config["name"], [])
+
     dir = os.path.join(config["out_dir"], config["name"])
-    result = subprocess.run(
-        ["find", dir, "-type", "f", "-mtime", "-1", "-print"], stdout=subprocess.PIPE
-    )
+    return recent_files.new_files(dir)
 
-    if result.stdout:
-        return result.stdout.decode("utf-8").strip().split("\n")
-    else:
-        return []
+
+def report_window(config):
+    """End of the report and how many periods before it are counted."""
+    end = datetime.combine(datetime.utcnow().date() - timedelta(1), datetime.min.time())
+    span = max(global_args.span, 0)
+    return end, max(YEAR, span) * period.per_day(config)
+
+
+def stale_periods(config, first, count):
+    """Stored presence and the indices of the periods to test again.
+
+    The last RECHECK_DAYS are always tested, as are periods not yet known
+    and periods last seen missing, which backfill may since have filled.
+    """
+    import numpy as np
+
+    present, known = history.load(config, first, count)
+    recheck = min(count, RECHECK_DAYS * period.per_day(config))
+    known[count - recheck:] = False
+    return present, np.flatnonzero(~(known & present))
+
+
+def find_presence(config, end, count):
+    """Presence bitmap for the count periods before end.
+
+    With a coverage history, only stale periods are tested against the
+    archive.
+    """
+    from filefetcher import bitmap
+
+    if history is None:
+        return bitmap.build(config, archive.exists, end, count)
+
+    first = end - count * period.get_period(config)
+    present, stale = stale_periods(config, first, count)
+    bitmap.refresh(config, archive.exists, first, present, stale)
+    logger.debug("%s: tested %d of %d periods", config["name"], len(stale), count)
+    history.store(config, first, present)
+    return present
 
 
 def count_files(config):
-    files = {"weekly": 0, "monthly": 0, "yearly": 0, "ad_hoc": 0, "missing": []}
-    day = datetime.utcnow().date() - timedelta(2)
-    week_ago = day - timedelta(7)
-    month_ago = day - timedelta(30)
-    year_ago = day - timedelta(30)
-    ad_hoc_ago = day - timedelta(global_args.span)
-
-    missing = None
-    while day > min(year_ago, ad_hoc_ago):
-        out_str = Template(config["out_path"]).substitute(config)
-        out_path = day.strftime(out_str)
-        file = os.path.join(config["out_dir"], out_path)
-        if os.path.exists(file):
-            if missing is not None:
-                files["missing"].append(missing)
-                missing = None
-            files["ad_hoc"] += 1
-            files["yearly"] += 1 if day > year_ago else 0
-            files["monthly"] += 1 if day > month_ago else 0
-            files["weekly"] += 1 if day > week_ago else 0
-        else:
-            if missing is None:
-                missing = [day, day]
-            else:
-                missing[0] = day
-        day -= timedelta(1)
+    from filefetcher import bitmap
+
+    step = period.get_period(config)
+    per_day = period.per_day(config)
+    span = max(global_args.span, 0)
+    end, count = report_window(config)
+
+    present = find_presence(config, end, count)
+    files = bitmap.window_counts(
+        present,
+        {
+            "weekly": WEEK * per_day,
+            "monthly": MONTH * per_day,
+            "yearly": YEAR * per_day,
+            "ad_hoc": span * per_day,
+        },
+    )
 
-    if missing is not None:
-        files["missing"].append(missing)
+    missing = bitmap.missing_spans(present, end, step, max(MONTH, span) * per_day)
+    if step == period.DAY:
+        missing = [[first.date(), last.date()] for first, last in missing]
+    files["missing"] = missing
 
     return files
 
 
 def get_coverage(config):
     if "out_path" not in config:
-        return {"weekly": 0, "monthly": 0, "yearly": 0, "ad_hoc": 0, "missing": []}
+        return {
+            "weekly": 0,
+            "monthly": 0,
+            "yearly": 0,
+            "ad_hoc": 0,
+            "missing": [],
+            "weekly_change": None,
+        }
 
     files = count_files(config)
+    per_day = period.per_day(config)
     coverage = {}
-    coverage["weekly"] = 100 * files["weekly"] / 7
-    coverage["monthly"] = 100 * files["monthly"] / 30
-    coverage["yearly"] = 100 * files["yearly"] / 365.25
-    coverage["ad_hoc"] = 100 * files["ad_hoc"] / global_args.span
+    coverage["weekly"] = 100 * files["weekly"] / (WEEK * per_day)
+    coverage["monthly"] = 100 * files["monthly"] / (MONTH * per_day)
+    coverage["yearly"] = 100 * files["yearly"] / (YEAR * per_day)
+    if global_args.span > 0:
+        coverage["ad_hoc"] = 100 * files["ad_hoc"] / (global_args.span * per_day)
+    else:
+        coverage["ad_hoc"] = 0
 
     coverage["missing"] = files["missing"]
+    coverage["weekly_change"] = weekly_change(config["name"], coverage["weekly"])
     return coverage
 
 
+def weekly_change(name, weekly):
+    """Change in weekly coverage since the report a week ago, if known."""
+    if history is None:
+        return None
+
+    today = datetime.utcnow().date()
+    history.record_weekly(today, name, weekly)
+    last_week = history.weekly(today - timedelta(WEEK), name)
+    if last_week is None:
+        return None
+    return weekly - last_week
+
+
 def process_datalogger(config):
     logger_results = {}
     logger_results["name"] = config["name"]
@@ -330,18 +451,12 @@ def process_datalogger(config):
     return logger_results
 
 
-def find_datalogger_files(config):
+def process_queue(config, dataloggers):
     queue = {"name": config["name"], "dataloggers": []}
-    for datalogger in config["dataloggers"]:
-        logger_results = process_datalogger(datalogger)
+    for logger_results in dataloggers:
         if logger_results:
             queue["dataloggers"].append(logger_results)
 
-    return queue
-
-
-def process_queue(config):
-    queue = find_datalogger_files(config)
     daily_total = 0
     weekly = 0
     monthly = 0
@@ -363,19 +478,219 @@ def process_queue(config):
     return queue
 
 
-def process_queues(config):
-    queues = []
+def open_history():
+    global history
+
+    history = None
+    history_db = tutil.get_env_var(HISTORY_DB_ENV, default="")
+    if history_db:
+        history = CoverageHistory(history_db)
+
+
+def logger_dirs(config):
+    """Directories holding the stale periods of config."""
+    if "out_path" not in config:
+        return set()
+
+    step = period.get_period(config)
+    end, count = report_window(config)
+    first = end - count * step
+    dirs = set()
+    for i in stale_periods(config, first, count)[1]:
+        out_path = period.expand(config, "out_path", first + int(i) * step)
+        dirs.add(os.path.dirname(os.path.join(config["out_dir"], out_path)))
+    return dirs
+
+
+def outermost(dirs):
+    """dirs without those below another of dirs, which scan() would repeat."""
+    roots = []
+    for dir in sorted(os.path.normpath(dir) for dir in dirs):
+        if not roots or not dir.startswith(os.path.join(roots[-1], "")):
+            roots.append(dir)
+    return roots
+
+
+def scan_archive(config):
+    """Snapshot the archive, or with a coverage history just the parts needed."""
+    global archive, recent_files, new_fetches
+
+    roots = set()
     for queue in config["queues"]:
         if "disabled" in queue and queue["disabled"]:
-            logger.info("Queue %s is disabled, skiping it.", queue["name"])
-        else:
-            queues.append(process_queue(queue))
+            continue
+        for datalogger in queue["dataloggers"]:
+            if history is None:
+                roots.add(datalogger["out_dir"])
+            else:
+                roots.update(logger_dirs(datalogger))
 
-    return queues
+    workers = config.get("reportWorkers", DEFAULT_WORKERS)
+    archive = archivescan.scan(outermost(roots), workers)
+    since = time.time() - NEW_FILE_AGE.total_seconds()
+    if history is None:
+        recent_files = archive.recent(since)
+    else:
+        new_fetches = history.fetched_since(since)
 
 
-def send_email(html):
-    msg = MIMEMultipart("alternative")
+def process_queues(config):
+    """Process every datalogger of every enabled queue on a shared pool.
+
+    Results are gathered in config order, so the report doesn't depend on
+    which datalogger finishes first.
+    """
+    workers = config.get("reportWorkers", DEFAULT_WORKERS)
+    pending = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report") as pool:
+        for queue in config["queues"]:
+            if "disabled" in queue and queue["disabled"]:
+                logger.info("Queue %s is disabled, skiping it.", queue["name"])
+            else:
+                futures = [
+                    pool.submit(process_datalogger, datalogger)
+                    for datalogger in queue["dataloggers"]
+                ]
+                pending.append((queue, futures))
+
+        return [
+            process_queue(queue, [future.result() for future in futures])
+            for queue, futures in pending
+        ]
+
+
+def truncated_ending(stack, size):
+    """Close the open elements in stack around a note that the report stops."""
+    body = 0
+    for outer in ("body", "html"):
+        if outer in stack:
+            body = stack.index(outer) + 1
+            break
+    closing = "".join("</{}>".format(tag) for tag in reversed(stack[body:]))
+    closing_body = "".join("</{}>".format(tag) for tag in reversed(stack[:body]))
+    return closing + TRUNCATED.format(size) + closing_body
+
+
+def render_report(queues, max_size):
+    """Stream the HTML report, keeping it under max_size characters.
+
+    The report is only cut between tags, and elements left open are closed.
+    The head and summary table are always kept, even if they don't fit.
+    """
+    from jinja2 import Template as jinjatmpl
+
+    tmpl = jinjatmpl(EMAIL_TEMPLATE, trim_blocks=True, lstrip_blocks=True)
+    html = io.StringIO()
+    chunks = tmpl.generate(
+        queues=queues,
+        style=STYLE,
+        ad_hoc=global_args.span,
+        compact=global_args.compact,
+        max_items=global_args.max_items,
+    )
+    elements = OpenElements()
+    cut = None
+    stack = []
+    for chunk in chunks:
+        html.write(chunk)
+        elements.feed(chunk)
+        size = html.tell()
+        # Nothing before the end of the summary table is cut.
+        if elements.in_tag() or "table" not in elements.closed:
+            if size <= max_size or cut is None:
+                continue
+        elif (
+            cut is None
+            or size + len(truncated_ending(elements.stack, size)) <= max_size
+        ):
+            cut = size
+            stack = list(elements.stack)
+            continue
+
+        logger.info("Report truncated at %d characters", cut)
+        html.seek(cut)
+        html.truncate()
+        html.write(truncated_ending(stack, cut))
+        break
+
+    return html.getvalue()
+
+
+def report_rows(queues):
+    """Summary rows, listing at most --max-items missing spans each."""
+    for queue in queues:
+        for datalogger in queue["dataloggers"]:
+            coverage = datalogger["coverage"]
+            yield {
+                "queue": queue["name"],
+                "datalogger": datalogger["name"],
+                "retrieved": len(datalogger["new_files"]),
+                "weekly": round(coverage["weekly"], 1),
+                "monthly": round(coverage["monthly"], 1),
+                "yearly": round(coverage["yearly"], 1),
+                "ad_hoc": round(coverage["ad_hoc"], 1),
+                "weekly_change": coverage["weekly_change"],
+                "missing": [
+                    [str(first), str(last)]
+                    for first, last in coverage["missing"][: global_args.max_items]
+                ],
+                "missing_spans": len(coverage["missing"]),
+            }
+
+
+def json_attachment(queues):
+    rows = list(report_rows(queues))
+    part = MIMEApplication(json.dumps(rows, indent=1).encode(), "json")
+    part.add_header("Content-Disposition", "attachment", filename="report.json")
+    return part
+
+
+def csv_attachment(queues):
+    out = io.StringIO()
+    writer = None
+    for row in report_rows(queues):
+        del row["missing"]
+        row["missing"] = row.pop("missing_spans")
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+
+    part = MIMEText(out.getvalue(), "csv")
+    part.add_header("Content-Disposition", "attachment", filename="report.csv")
+    return part
+
+
+ATTACHMENTS = {"json": json_attachment, "csv": csv_attachment}
+
+
+def make_attachments(queues):
+    """Attachments asked for with --attach and their size in characters.
+
+    Attachments count toward --max-size; one which doesn't fit is left out.
+    """
+    attachments = []
+    size = 0
+    for kind in global_args.attach:
+        attachment = ATTACHMENTS[kind](queues)
+        attachment_size = len(attachment.as_string())
+        if size + attachment_size > global_args.max_size:
+            logger.warning(
+                "Leaving out %s attachment, %d characters won't fit",
+                kind,
+                attachment_size,
+            )
+            continue
+        attachments.append(attachment)
+        size += attachment_size
+    return attachments, size
+
+
+def send_email(html, attachments=()):
+    if attachments:
+        msg = MIMEMultipart("mixed")
+    else:
+        msg = MIMEMultipart("alternative")
     day = datetime.utcnow().date() - timedelta(2)
     msg["Subject"] = day.strftime("GPS retrieval %x")
     if global_args.span > 0:
@@ -385,6 +700,10 @@ def send_email(html):
     msg["To"] = tutil.get_env_var("REPORT_RECIPIENT")
 
     msg.attach(MIMEText(html, "html"))
+    for attachment in attachments:
+        msg.attach(attachment)
+
+    import smtplib
 
     try:
         s = smtplib.SMTP(tutil.get_env_var("MAILHOST"))
@@ -415,12 +734,17 @@ def main():
         msg = "Environment variable %s unset, exiting.".format(CONFIG_FILE_ENV)
         tutil.exit_with_error(msg)
 
+    scan_start = time.time()
+    open_history()
+    scan_archive(config)
     queues = process_queues(config)
     logger.debug("Queues: %s", queues)
-    tmpl = jinjatmpl(EMAIL_TEMPLATE)
-    logger.debug(tmpl)
-    email = tmpl.render(queues=queues, style=STYLE, ad_hoc=global_args.span)
-    send_email(email)
+    attachments, size = make_attachments(queues)
+    email = render_report(queues, global_args.max_size - size)
+    send_email(email, attachments)
+    if history is not None:
+        history.forget_fetches(scan_start - NEW_FILE_AGE.total_seconds())
+        history.close()
     logger.debug("That's all for now, bye.")
     logging.shutdown()
 
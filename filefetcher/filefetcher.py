@@ -10,34 +10,34 @@
 """ Retrieve GPS files."""
 
 from datetime import timedelta, datetime
-from string import Template
 import signal
 import logging
 import os
-import sys
-import socket
-import struct
 import pathlib
 from urllib.parse import urlparse
 import errno
 from multiprocessing import Process
 import argparse
+import fcntl
 
-import ruamel.yaml
 import tomputils.util as tutil
-import pycurl
-import humanize
-import multiprocessing_logging
 from single import Lock
 
+from filefetcher import period, profiling, queuelogging
+from filefetcher.profiling import phase
+from filefetcher.publisher import Publisher, SPOOL_DIR_ENV, make_out_dir
+from filefetcher.transport import CurlTransport, TransportError
+
 REQ_VERSION = (3, 0)
-WINDOW_SIZE_FACTOR = 2
 CONFIG_FILE_ENV = "FF_CONFIG"
-MAX_UPDATE_FREQ = timedelta(seconds=10)
 START_TIME = datetime.now()
 
 
 args = None
+transport = CurlTransport()
+publisher = None
+hooks = None
+fetch_history = None
 
 
 def _arg_parse():
@@ -48,10 +48,18 @@ def _arg_parse():
         help="Only download most recent daily files.",
         action="store_true",
     )
+    parser.add_argument(
+        "--profile",
+        help="Profile each queue, writing .pstats files to $FF_LOG_DIR. "
+        + "May also be enabled by setting ${}.".format(profiling.PROFILE_ENV),
+        action="store_true",
+    )
     return parser.parse_args()
 
 
 def parse_config():
+    import ruamel.yaml
+
     config_file = pathlib.Path(tutil.get_env_var(CONFIG_FILE_ENV))
     yaml = ruamel.yaml.YAML()
     try:
@@ -68,125 +76,110 @@ def parse_config():
     return global_config
 
 
-def setRecvSpeed(curl, speed):
-    if speed < 1:
-        return
-
-    def sockoptfunction(curlfd, purpose):
-        logger.debug("Setting RECV_SPEED to %s b/s", speed)
-        sock = socket.socket(fileno=curlfd)
-
-        window_size = speed * WINDOW_SIZE_FACTOR
-        if sys.maxsize > 2 ** 32:
-            size = struct.pack(str("ll"), int(window_size), int(0))
-        else:
-            size = struct.pack(str("ii"), int(window_size), int(0))
-
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
-        sock.detach()
-        return 0
-
-    curl.setopt(curl.SOCKOPTFUNCTION, sockoptfunction)
-    curl.setopt(curl.MAX_RECV_SPEED_LARGE, speed)
-    curl.setopt(curl.BUFFERSIZE, speed * WINDOW_SIZE_FACTOR)
-
-
-def is_backfill_finished(datalogger, day):
+def is_backfill_finished(datalogger, when):
     if "backfill" not in datalogger or "no-backfill" in args:
         logger.debug("No backfill configured")
         return True
 
-    backfill_date = datetime.strptime(datalogger["backfill"], "%m/%d/%Y")
-    backfill_date = backfill_date.date()
-    if day > backfill_date:
-        logger.debug("Continuing to backfill from %s to %s", day, backfill_date)
+    backfill_date = period.parse_date(datalogger["backfill"])
+    if when > backfill_date:
+        logger.debug("Continuing to backfill from %s to %s", when, backfill_date)
         return False
     else:
         logger.info("Completed backfill to %s", backfill_date)
         return True
 
 
-def create_curl(datalogger, url):
-    c = pycurl.Curl()
-    c.setopt(c.VERBOSE, True)
-    if "userpwd" in datalogger:
-        userpwd = tutil.get_env_var(datalogger["userpwd"], secret=True)
-        logger.debug("Setting userpw to whatever is in $%s", datalogger["userpwd"])
-        c.setopt(pycurl.USERPWD, userpwd)
+def remove_file(file):
+    try:
+        os.remove(file)
+    except OSError as e2:
+        if e2.errno != errno.ENOENT:
+            raise
 
-    if "recvSpeed" in datalogger:
-        setRecvSpeed(c, datalogger["recvSpeed"])
 
-    if "port" in datalogger:
-        c.setopt(pycurl.PORT, datalogger["port"])
+def fetched(datalogger, out_file):
+    if fetch_history is not None:
+        import sqlite3
 
-    last_update = datetime.now()
+        try:
+            fetch_history.record_fetch(datalogger["name"], out_file)
+        except sqlite3.Error as e:
+            logger.warning("Cannot record %s in report history: %s", out_file, e)
 
-    def progress(download_t, download_d, upload_t, upload_d):
-        nonlocal last_update
-        now = datetime.now()
-        if now > last_update + MAX_UPDATE_FREQ:
-            download_d_str = humanize.naturalsize(download_d, format="%.2f")
-            download_t_str = humanize.naturalsize(download_t, format="%.2f")
-            logger.debug(
-                "Downloaded %s of %s from %s", download_d_str, download_t_str, url
-            )
-            last_update = now
-        return 0
-
-    if "low_speed_limit" in datalogger:
-        logger.info(
-            "Setting low speed limit to %db/s over %ds",
-            datalogger["low_speed_limit"],
-            datalogger["low_speed_time"],
-        )
-        c.setopt(c.LOW_SPEED_LIMIT, datalogger["low_speed_limit"])
-        c.setopt(c.LOW_SPEED_TIME, datalogger["low_speed_time"])
+    if hooks is not None and "on_fetched" in datalogger:
+        hooks.submit(datalogger, out_file)
 
-    c.setopt(c.NOPROGRESS, False)
-    c.setopt(c.XFERINFOFUNCTION, progress)
-    c.setopt(c.URL, url)
 
-    return c
+def open_fetch_history():
+    """Where dailyreport looks for retrieved files, if $FF_REPORT_DB is set."""
+    from filefetcher.history import HISTORY_DB_ENV, CoverageHistory
 
+    history_db = tutil.get_env_var(HISTORY_DB_ENV, default="")
+    if not history_db:
+        return None
+    return CoverageHistory(history_db)
 
-def make_out_dir(dir):
-    try:
-        os.makedirs(dir)
-        logger.info("Created %s", dir)
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise
 
+def find_datalogger(dataloggers, out_file):
+    """The datalogger which out_file was retrieved for, if any.
 
-def remove_file(file):
-    try:
-        os.remove(file)
-    except OSError as e2:
-        if e2.errno != errno.ENOENT:
-            raise
+    out_file is matched against each datalogger's out_path. An out_path
+    using directives period can't match falls back to its literal prefix.
+    """
+    for datalogger in dataloggers:
+        out_dir = datalogger["out_dir"]
+        if "out_path" not in datalogger:
+            prefix = os.path.join(datalogger["name"], "")
+        else:
+            try:
+                regex = period.path_regex(datalogger, "out_path")
+            except ValueError:
+                prefix = period.path_prefix(datalogger, "out_path")
+            else:
+                if regex.fullmatch(os.path.relpath(out_file, out_dir)):
+                    return datalogger
+                continue
 
+        if prefix and out_file.startswith(os.path.join(out_dir, prefix)):
+            return datalogger
+    return None
 
-def fetch_file(c, out_file, resume):
+
+def temp_path(out_file):
+    """Where out_file is kept while it's being retrieved."""
     tmp_dir = tutil.get_env_var("FF_TMP_DIR", default=".")
     tmp_file = "{}.tmp".format(os.path.basename(out_file))
-    tmp_path = pathlib.Path(tmp_dir) / tmp_file
+    return pathlib.Path(tmp_dir) / tmp_file
+
+
+def fetch_file(datalogger, url, out_file, resume, finalize=True):
+    tmp_path = temp_path(out_file)
 
     if os.path.exists(tmp_path) and resume:
-        range = "{}-".format(os.path.getsize(tmp_path))
-        logger.info("Resuming download of %s for bytes %s", tmp_path, range)
-        c.setopt(c.RANGE, range)
+        offset = os.path.getsize(tmp_path)
+        logger.info("Resuming download of %s for bytes %d-", tmp_path, offset)
         mode = "ab"
     else:
+        offset = 0
         mode = "wb"
 
     try:
         with open(tmp_path, mode, buffering=0) as f:
-            c.setopt(c.WRITEDATA, f)
-            c.perform()
-            make_out_dir(os.path.dirname(out_file))
-            os.rename(tmp_path, out_file)
-    except pycurl.error as e:
+            with phase("transfer"):
+                transport.fetch(datalogger, url, f, offset, resume)
+            if not finalize:
+                return False
+            with phase("rename"):
+                if publisher is None:
+                    make_out_dir(os.path.dirname(out_file))
+                    os.rename(tmp_path, out_file)
+                    fetched(datalogger, out_file)
+                else:
+                    publisher.submit(
+                        tmp_path, out_file, lambda path: fetched(datalogger, path)
+                    )
+    except TransportError as e:
         minor_errors = tutil.get_env_var("PYCURL_MINOR_ERRORS").split(",")
         minor_errors = [int(i) for i in minor_errors]
 
@@ -201,10 +194,9 @@ def fetch_file(c, out_file, resume):
     return False
 
 
-def find_out_file(datalogger, day, url):
+def find_out_file(datalogger, when, url):
     if "out_path" in datalogger:
-        out_str = Template(datalogger["out_path"]).substitute(datalogger)
-        out_path = day.strftime(out_str)
+        out_path = period.expand(datalogger, "out_path", when)
     else:
         url_parts = urlparse(url)
         out_path = pathlib.Path(datalogger["name"]) / url_parts.path[1:]
@@ -238,12 +230,13 @@ def is_too_late():
         return False
 
 
-def has_met_minimum_lookback(datalogger, day):
+def has_met_minimum_lookback(datalogger, when):
     if "minimumLookback" not in datalogger:
         return True
 
     span = timedelta(days=datalogger["minimumLookback"])
-    if day < datetime.now().date() - span:
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    if when < today - span:
         logger.debug(
             "satisfied minimumLookback=%d for %s",
             datalogger["minimumLookback"],
@@ -254,37 +247,71 @@ def has_met_minimum_lookback(datalogger, day):
         return False
 
 
-def retrieve_file(datalogger, day):
-    url_str = Template(datalogger["url"]).substitute(datalogger)
-    url = day.strftime(url_str)
-    out_path = find_out_file(datalogger, day, url)
-    if os.path.exists(out_path):
+def have_file(out_path):
+    with phase("presence"):
+        if os.path.exists(out_path):
+            return True
+        return publisher is not None and publisher.is_pending(out_path)
+
+
+def resume_downloads(datalogger):
+    # Tailed files must resume, that's how they're finalized.
+    return datalogger.get("tail", False) or datalogger["partial_downloads"]
+
+
+def retrieve_file(datalogger, when):
+    url = period.expand(datalogger, "url", when)
+    out_path = find_out_file(datalogger, when, url)
+    if have_file(out_path):
         logger.info("I already have %s", out_path)
         finished = True
     else:
         logger.info("Fetching %s from %s", out_path, url)
-        c = create_curl(datalogger, url)
-        finished = fetch_file(c, out_path, datalogger["partial_downloads"])
+        finished = fetch_file(datalogger, url, out_path, resume_downloads(datalogger))
 
     return finished
 
 
-def retrieve_directory(datalogger, day):
-    url_str = Template(datalogger["url"]).substitute(datalogger)
-    url = day.strftime(url_str)
-    out_path = find_out_file(datalogger, day, url)
-    if os.path.exists(out_path):
+def tail_file(datalogger, when):
+    """Append whatever has been added to the current file since the last poll.
+
+    The partial file is kept with other temp files. Once its period is over,
+    the normal poll for it resumes from the partial file and renames the
+    result into out_path.
+    """
+    url = period.expand(datalogger, "url", when)
+    out_path = find_out_file(datalogger, when, url)
+    if have_file(out_path):
+        return
+
+    logger.info("Tailing %s from %s", out_path, url)
+    fetch_file(datalogger, url, out_path, True, finalize=False)
+
+
+def tail_loggers(dataloggers):
+    now = datetime.utcnow()
+    for datalogger in dataloggers:
+        if datalogger.get("disabled", False) or not datalogger.get("tail", False):
+            continue
+        if is_too_late() or is_running_too_long():
+            return
+        tail_file(datalogger, period.floor(now, period.get_period(datalogger)))
+
+
+def retrieve_directory(datalogger, when):
+    url = period.expand(datalogger, "url", when)
+    out_path = find_out_file(datalogger, when, url)
+    if have_file(out_path):
         logger.info("I already have %s", out_path)
         finished = True
     else:
         logger.info("Fetching %s from %s", out_path, url)
-        c = create_curl(datalogger, url)
-        finished = fetch_file(c, out_path, datalogger["partial_downloads"])
+        finished = fetch_file(datalogger, url, out_path, resume_downloads(datalogger))
 
     return finished
 
 
-def poll_logger(datalogger, day):
+def poll_logger(datalogger, when):
     if "disabled" in datalogger and datalogger["disabled"]:
         logger.debug("Skipping %s (disabled)", datalogger["name"])
         return True
@@ -292,44 +319,119 @@ def poll_logger(datalogger, day):
     if is_too_late() or is_running_too_long():
         return True
 
-    finished = retrieve_file(datalogger, day)
-    finished = finished and is_backfill_finished(datalogger, day)
-    finished = finished and has_met_minimum_lookback(datalogger, day)
+    finished = retrieve_file(datalogger, when)
+    finished = finished and is_backfill_finished(datalogger, when)
+    finished = finished and has_met_minimum_lookback(datalogger, when)
 
     return finished
 
 
-def poll_loggers(dataloggers, day):
+def poll_loggers(dataloggers):
+    """Poll one period for each logger, stepping back a period for the next round.
+
+    dataloggers is a list of (datalogger, period start) pairs.
+    """
     not_finished = []
-    for datalogger in dataloggers:
-        finished = poll_logger(datalogger, day)
+    for datalogger, when in dataloggers:
+        finished = poll_logger(datalogger, when)
 
         if finished:
             logger.info("All done with logger %s.", datalogger["name"])
         else:
-            not_finished.append(datalogger)
+            not_finished.append((datalogger, when - period.get_period(datalogger)))
 
     return not_finished
 
 
-def poll_queue(config):
+def lock_path(config):
     tmp_dir = tutil.get_env_var("FF_TMP_DIR", default=".")
     tmp_file = "{}.lock".format(config["name"])
-    lock_file = pathlib.Path(tmp_dir) / tmp_file
+    return pathlib.Path(tmp_dir) / tmp_file
+
 
-    lock = Lock(lock_file)
-    gotlock, pid = lock.lock_pid()
+def is_locked(config):
+    """Is another process polling this queue?
+
+    The queue's flock is taken and released at once to find out, without
+    writing a pid to the lock file as Lock does.
+    """
+    try:
+        fd = os.open(lock_path(config), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def poll_queue(config):
+    queuelogging.set_queue_name(config["name"])
+    lock = Lock(lock_path(config))
+    with phase("lock"):
+        gotlock, pid = lock.lock_pid()
     if not gotlock:
         logger.info("Queue {} locked, skipping".format(config["name"]))
         return
 
+    global publisher, hooks, fetch_history
     try:
-        day = datetime.utcnow().date()
+        fetch_history = open_fetch_history()
+        if any("on_fetched" in datalogger for datalogger in config["dataloggers"]):
+            from filefetcher.hooks import HookRunner
+
+            hooks = HookRunner(
+                workers=global_config.get("hookWorkers", 2),
+                depth=global_config.get("hookQueueDepth", 32),
+            )
+
+        spool_dir = tutil.get_env_var(SPOOL_DIR_ENV, default="")
+        if spool_dir:
+            publisher = Publisher(
+                os.path.join(spool_dir, config["name"]),
+                workers=global_config.get("publishWorkers", 2),
+                depth=global_config.get("publishQueueDepth", 16),
+                retries=global_config.get("publishRetries", 3),
+            )
+
+            def recovered(out_file):
+                datalogger = find_datalogger(config["dataloggers"], out_file)
+                if datalogger is None:
+                    return None
+                return lambda path: fetched(datalogger, path)
+
+            publisher.recover(recovered)
+
+        now = datetime.utcnow()
         dataloggers = config["dataloggers"]
+        if "recvSchedule" in config:
+            for datalogger in dataloggers:
+                if "recvSchedule" not in datalogger:
+                    datalogger["recvSchedule"] = config["recvSchedule"]
+
+        tail_loggers(dataloggers)
+        dataloggers = [(d, period.last_complete(d, now)) for d in dataloggers]
         while dataloggers:
-            day -= timedelta(1)
-            dataloggers = poll_loggers(dataloggers, day)
+            dataloggers = poll_loggers(dataloggers)
     finally:
+        if publisher is not None:
+            logger.info("Waiting for files from queue %s to publish.", config["name"])
+            publisher.close()
+            publisher = None
+
+        if hooks is not None:
+            logger.info("Waiting for on_fetched stages from queue %s.", config["name"])
+            hooks.close()
+            hooks = None
+
+        if fetch_history is not None:
+            fetch_history.close()
+            fetch_history = None
+
         logger.info("All done with queue %s.", config["name"])
         for handler in logger.handlers:
             handler.flush()
@@ -344,17 +446,38 @@ def poll_queue(config):
         logger.info("All done with queue %s.", config["name"])
 
 
-def poll_queues():
+def profile_queue(config):
+    log_dir = tutil.get_env_var("FF_LOG_DIR", default=".")
+    profiling.profile(config["name"], log_dir, poll_queue, config)
+
+
+def poll_queues(queues):
+    if profiling.is_enabled(args):
+        target = profile_queue
+    else:
+        target = poll_queue
+
     procs = []
+    for queue in queues:
+        p = Process(target=target, args=(queue,))
+        procs.append(p)
+        p.start()
+
+    return procs
+
+
+def find_queues():
+    """Queues which are enabled and which no other process is polling."""
+    queues = []
     for queue in global_config["queues"]:
         if "disabled" in queue and queue["disabled"]:
             logger.info("Queue %s is disabled, skiping it.", queue["name"])
+        elif is_locked(queue):
+            logger.info("Queue %s locked, skipping", queue["name"])
         else:
-            p = Process(target=poll_queue, args=(queue,))
-            procs.append(p)
-            p.start()
+            queues.append(queue)
 
-    return procs
+    return queues
 
 
 def main():
@@ -363,7 +486,6 @@ def main():
 
     global logger
     logger = tutil.setup_logging("filefetcher errors")
-    multiprocessing_logging.install_mp_handler()
 
     msg = (
         "Python interpreter is too old. I need at least {} "
@@ -381,11 +503,19 @@ def main():
         msg = "Environment variable %s unset, exiting.".format(CONFIG_FILE_ENV)
         tutil.exit_with_error(msg)
 
-    procs = poll_queues()
+    queues = find_queues()
+    if not queues:
+        logger.info("Nothing to do, bye.")
+        logging.shutdown()
+        return
+
+    listener = queuelogging.start(logger)
+    procs = poll_queues(queues)
     for proc in procs:
         proc.join()
 
     logger.debug("That's all for now, bye.")
+    queuelogging.stop(listener)
     logging.shutdown()
 
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Remember archive coverage between report runs.
+
+Coverage is kept in a SQLite database as one packed bitmap per datalogger per
+year, along with a mask of which periods in that year have been checked. A
+bitmap is tied to the datalogger's out_dir, out_path and period; if any of
+them change, the old bitmap is ignored. Each report's weekly coverage is kept
+as well, so reports can show how coverage is trending.
+
+filefetcher records each file it retrieves in the same database, so a report
+can list recent files without walking the whole archive to find them.
+"""
+
+from datetime import datetime
+import sqlite3
+import threading
+import time
+
+from filefetcher import period
+
+HISTORY_DB_ENV = "FF_REPORT_DB"
+LOCK_TIMEOUT = 60  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS presence (
+    logger TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    bits BLOB NOT NULL,
+    known BLOB NOT NULL,
+    PRIMARY KEY (logger, year)
+);
+CREATE TABLE IF NOT EXISTS fetched (
+    fetch_time REAL NOT NULL,
+    logger TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fetched_time ON fetched (fetch_time);
+CREATE TABLE IF NOT EXISTS weekly (
+    report_date TEXT NOT NULL,
+    logger TEXT NOT NULL,
+    coverage REAL NOT NULL,
+    PRIMARY KEY (report_date, logger)
+);
+"""
+
+
+def bitmap_key(config):
+    period_str = config.get("period", period.DEFAULT_PERIOD)
+    return "|".join((config["out_dir"], config["out_path"], period_str))
+
+
+def _year_span(year, step):
+    start = datetime(year, 1, 1)
+    return start, (datetime(year + 1, 1, 1) - start) // step
+
+
+def _overlap(first, count, step, year_start, year_count):
+    """Window index, year index and length of the overlap, or None."""
+    lo = max(first, year_start)
+    hi = min(first + count * step, year_start + year_count * step)
+    if hi <= lo:
+        return None
+    return (lo - first) // step, (lo - year_start) // step, (hi - lo) // step
+
+
+class CoverageHistory:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        # Every queue process records its fetches here, so wait for the others.
+        self.db = sqlite3.connect(path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def record_fetch(self, name, path, fetch_time=None):
+        if fetch_time is None:
+            fetch_time = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT INTO fetched VALUES (?, ?, ?)", (fetch_time, name, str(path))
+            )
+
+    def fetched_since(self, since):
+        """Paths fetched after since, a POSIX timestamp, keyed by logger."""
+        fetched = {}
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT DISTINCT logger, path FROM fetched WHERE fetch_time > ?"
+                " ORDER BY path",
+                (since,),
+            ).fetchall()
+        for name, path in rows:
+            fetched.setdefault(name, []).append(path)
+        return fetched
+
+    def forget_fetches(self, before):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM fetched WHERE fetch_time <= ?", (before,))
+
+    def _year(self, config, year):
+        row = self.db.execute(
+            "SELECT key, bits, known FROM presence WHERE logger = ? AND year = ?",
+            (config["name"], year),
+        ).fetchone()
+        if row is None or row[0] != bitmap_key(config):
+            return None
+        return row[1], row[2]
+
+    def load(self, config, first, count):
+        """Stored presence for count periods from first, and which are known."""
+        import numpy as np
+
+        step = period.get_period(config)
+        bits = np.zeros(count, dtype=bool)
+        known = np.zeros(count, dtype=bool)
+        last = first + (count - 1) * step
+        with self.lock:
+            for year in range(first.year, last.year + 1):
+                row = self._year(config, year)
+                if row is None:
+                    continue
+                year_start, year_count = _year_span(year, step)
+                w, y, n = _overlap(first, count, step, year_start, year_count)
+                year_bits = np.unpackbits(np.frombuffer(row[0], np.uint8))
+                year_known = np.unpackbits(np.frombuffer(row[1], np.uint8))
+                bits[w:w + n] = year_bits[y:y + n]
+                known[w:w + n] = year_known[y:y + n]
+        return bits, known
+
+    def store(self, config, first, bits):
+        """Save presence for len(bits) periods from first."""
+        import numpy as np
+
+        step = period.get_period(config)
+        count = len(bits)
+        last = first + (count - 1) * step
+        with self.lock, self.db:
+            for year in range(first.year, last.year + 1):
+                year_start, year_count = _year_span(year, step)
+                year_bits = np.zeros(year_count, dtype=bool)
+                year_known = np.zeros(year_count, dtype=bool)
+                row = self._year(config, year)
+                if row is not None:
+                    year_bits[:] = np.unpackbits(
+                        np.frombuffer(row[0], np.uint8), count=year_count
+                    )
+                    year_known[:] = np.unpackbits(
+                        np.frombuffer(row[1], np.uint8), count=year_count
+                    )
+                w, y, n = _overlap(first, count, step, year_start, year_count)
+                year_bits[y:y + n] = bits[w:w + n]
+                year_known[y:y + n] = True
+                self.db.execute(
+                    "INSERT OR REPLACE INTO presence VALUES (?, ?, ?, ?, ?)",
+                    (
+                        config["name"],
+                        year,
+                        bitmap_key(config),
+                        np.packbits(year_bits).tobytes(),
+                        np.packbits(year_known).tobytes(),
+                    ),
+                )
+
+    def record_weekly(self, report_date, name, coverage):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO weekly VALUES (?, ?, ?)",
+                (report_date.isoformat(), name, coverage),
+            )
+
+    def weekly(self, report_date, name):
+        """Weekly coverage reported for name on report_date, if any."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT coverage FROM weekly WHERE report_date = ? AND logger = ?",
+                (report_date.isoformat(), name),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def close(self):
+        self.db.close()
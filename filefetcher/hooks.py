@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Run post-download processing on newly retrieved files.
+
+A datalogger may list on_fetched stages. Each stage is either a command,
+which may use PEP 292-style substitution strings from the datalogger map plus
+${file}, or a Python entry point in module:function form which is called with
+the file path and the datalogger map. The stages for a file run in order on a
+pool of worker threads; a stage which fails stops the rest for that file.
+"""
+
+import importlib
+import logging
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from string import Template
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_DEPTH = 32
+DEFAULT_TIMEOUT = 3600  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed, failed):
+        self.runs += 1
+        self.failures += 1 if failed else 0
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+def stage_name(stage):
+    if "name" in stage:
+        return stage["name"]
+    return stage.get("command", stage.get("entry_point"))
+
+
+def load_entry_point(entry_point):
+    module_name, func_name = entry_point.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+class HookRunner:
+    """Dispatch on_fetched stages to a bounded thread pool.
+
+    submit() blocks once depth files are waiting so a slow stage can't build
+    an unbounded backlog.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, depth=DEFAULT_QUEUE_DEPTH):
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="on_fetched"
+        )
+        self.slots = threading.BoundedSemaphore(depth)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.entry_points = {}
+
+    def submit(self, datalogger, out_file):
+        self.slots.acquire()
+        future = self.pool.submit(self._run, datalogger, str(out_file))
+        future.add_done_callback(lambda f: self.slots.release())
+
+    def _entry_point(self, entry_point):
+        with self.lock:
+            if entry_point not in self.entry_points:
+                self.entry_points[entry_point] = load_entry_point(entry_point)
+            return self.entry_points[entry_point]
+
+    def _run_stage(self, stage, datalogger, out_file):
+        if "entry_point" in stage:
+            self._entry_point(stage["entry_point"])(out_file, datalogger)
+        else:
+            mapping = dict(datalogger)
+            mapping["file"] = out_file
+            command = [
+                Template(arg).substitute(mapping)
+                for arg in shlex.split(stage["command"])
+            ]
+            subprocess.run(
+                command, check=True, timeout=stage.get("timeout", DEFAULT_TIMEOUT)
+            )
+
+    def _run(self, datalogger, out_file):
+        for stage in datalogger["on_fetched"]:
+            name = stage_name(stage)
+            start = time.perf_counter()
+            failed = False
+            try:
+                self._run_stage(stage, datalogger, out_file)
+            except Exception:
+                failed = True
+                logger.exception("on_fetched stage %s failed for %s", name, out_file)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.stats.setdefault(name, StageStats()).add(elapsed, failed)
+
+            if failed:
+                return
+            logger.debug(
+                "on_fetched stage %s took %.3fs for %s", name, elapsed, out_file
+            )
+
+    def close(self):
+        """Wait for outstanding stages and log per-stage timing."""
+        self.pool.shutdown(wait=True)
+        for name, stats in self.stats.items():
+            logger.info(
+                "on_fetched stage %s: %d runs, %d failed, %.3fs mean, %.3fs max",
+                name,
+                stats.runs,
+                stats.failures,
+                stats.total / stats.runs,
+                stats.max,
+            )
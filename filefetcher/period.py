@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Work with the file periods of a datalogger.
+
+A datalogger writes one file per period, one day unless its period says
+otherwise. A period is given as a number followed by d, h or m, e.g. 1h or
+15m, and must divide a day evenly. Each file is identified by the UTC
+datetime at which its period starts.
+
+URL and out_path patterns may use ${session}: 0 for daily files, otherwise
+the RINEX hour letter, a for 00h through x for 23h.
+"""
+
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+import re
+from string import Template
+
+DAY = timedelta(days=1)
+DEFAULT_PERIOD = "1d"
+UNITS = {"d": "days", "h": "hours", "m": "minutes"}
+DIRECTIVES = {
+    "Y": r"\d{4}",
+    "y": r"\d{2}",
+    "m": r"\d{2}",
+    "d": r"\d{2}",
+    "j": r"\d{3}",
+    "H": r"\d{2}",
+    "M": r"\d{2}",
+    "session": r"[0a-x]",
+}
+SESSION_MARK = "\0session\0"
+
+_patterns = {}
+_regexes = {}
+_identifiers = {}
+
+
+@lru_cache(maxsize=None)
+def parse_period(period):
+    period = str(period).strip()
+    try:
+        length = timedelta(**{UNITS[period[-1]]: int(period[:-1])})
+    except (IndexError, KeyError, ValueError):
+        raise ValueError("Cannot understand period {}".format(period))
+
+    if length <= timedelta(0) or length > DAY or DAY % length:
+        raise ValueError("Period {} does not divide a day evenly".format(period))
+    return length
+
+
+def get_period(datalogger):
+    return parse_period(datalogger.get("period", DEFAULT_PERIOD))
+
+
+def per_day(datalogger):
+    """How many files the datalogger writes each day."""
+    return DAY // get_period(datalogger)
+
+
+def floor(when, period):
+    """Start of the period which contains when."""
+    midnight = datetime.combine(when.date(), time())
+    return midnight + ((when - midnight) // period) * period
+
+
+def last_complete(datalogger, now=None):
+    """Start of the most recent period which has ended."""
+    if now is None:
+        now = datetime.utcnow()
+    period = get_period(datalogger)
+    return floor(now, period) - period
+
+
+def session(when, period):
+    if period == DAY:
+        return "0"
+    return chr(ord("a") + when.hour)
+
+
+def identifiers(template):
+    """Names of the values a PEP 292 template substitutes, except session."""
+    names = _identifiers.get(template)
+    if names is None:
+        names = set()
+        for match in Template.pattern.finditer(template):
+            name = match.group("named") or match.group("braced")
+            if name is not None and name != "session":
+                names.add(name)
+        names = tuple(sorted(names))
+        _identifiers[template] = names
+    return names
+
+
+def substitution_key(datalogger, key):
+    """Everything substituting into the datalogger's key pattern depends on."""
+    template = datalogger[key]
+    values = tuple(str(datalogger.get(name)) for name in identifiers(template))
+    return template, values
+
+
+def expand(datalogger, key, when):
+    """Fill in the datalogger's key pattern for the period starting at when.
+
+    PEP 292 substitution only varies with session and the values it uses, so
+    its result is cached and only strftime runs for every period.
+    """
+    period = get_period(datalogger)
+    sess = session(when, period)
+    cache_key = (substitution_key(datalogger, key), sess)
+    pattern = _patterns.get(cache_key)
+    if pattern is None:
+        pattern = Template(datalogger[key]).substitute(datalogger, session=sess)
+        _patterns[cache_key] = pattern
+    return when.strftime(pattern)
+
+
+@lru_cache(maxsize=None)
+def parse_date(date_str):
+    """Parse a backfill date in %m/%d/%Y form."""
+    return datetime.strptime(date_str, "%m/%d/%Y")
+
+
+def path_prefix(datalogger, key):
+    """The part of the datalogger's key pattern which never changes."""
+    pattern = Template(datalogger[key]).substitute(datalogger, session=SESSION_MARK)
+    return re.split("%|{}".format(re.escape(SESSION_MARK)), pattern)[0]
+
+
+def compile_pattern(pattern):
+    """Turn a strftime pattern into a regex which captures its fields.
+
+    Only the directives filefetcher patterns use are understood: %Y, %y, %m,
+    %d, %j, %H, %M and %%. A directive used more than once must match the
+    same text each time.
+    """
+    regex = []
+    seen = set()
+    for part in re.split("(%.|{})".format(re.escape(SESSION_MARK)), pattern):
+        if part == SESSION_MARK:
+            name = "session"
+        elif part == "%%":
+            regex.append("%")
+            continue
+        elif part.startswith("%") and len(part) == 2:
+            name = part[1]
+            if name not in DIRECTIVES:
+                raise ValueError("Cannot match %{} in {}".format(name, pattern))
+        else:
+            regex.append(re.escape(part))
+            continue
+
+        if name in seen:
+            regex.append("(?P={})".format(name))
+        else:
+            regex.append("(?P<{}>{})".format(name, DIRECTIVES[name]))
+            seen.add(name)
+
+    return re.compile("".join(regex))
+
+
+def path_regex(datalogger, key):
+    """Compiled regex matching every value of the datalogger's key pattern."""
+    cache_key = substitution_key(datalogger, key)
+    regex = _regexes.get(cache_key)
+    if regex is None:
+        pattern = Template(datalogger[key]).substitute(datalogger, session=SESSION_MARK)
+        regex = compile_pattern(pattern)
+        _regexes[cache_key] = regex
+    return regex
+
+
+def match_time(regex, text):
+    """Start of the period named by text, or None if regex doesn't match it."""
+    match = regex.fullmatch(text)
+    if match is None:
+        return None
+
+    fields = match.groupdict()
+    if "Y" in fields:
+        year = int(fields["Y"])
+    elif "y" in fields:
+        year = int(fields["y"])
+        year += 2000 if year < 69 else 1900
+    else:
+        return None
+
+    try:
+        if "j" in fields:
+            when = datetime(year, 1, 1) + timedelta(days=int(fields["j"]) - 1)
+        else:
+            when = datetime(year, int(fields["m"]), int(fields["d"]))
+
+        if "H" in fields:
+            hour = int(fields["H"])
+        elif fields.get("session", "0") != "0":
+            hour = ord(fields["session"]) - ord("a")
+        else:
+            hour = 0
+        return when.replace(hour=hour, minute=int(fields.get("M", 0)))
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Optional profiling of queue processes.
+
+When enabled, each queue runs under cProfile and keeps a wall-clock account
+of its main phases. Phases are exclusive: time spent logging while a transfer
+is in progress is charged to logging, not to transfer. Only the queue's main
+thread is timed. When profiling is off, phase() hands back a shared no-op
+context manager.
+"""
+
+import cProfile
+import contextlib
+import logging
+import os
+import threading
+import time
+
+PHASES = ("lock", "presence", "transfer", "rename", "logging")
+PROFILE_ENV = "FF_PROFILE"
+
+logger = logging.getLogger(__name__)
+timer = None
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class PhaseTimer:
+    """Accumulate exclusive wall-clock time per named phase."""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.start = time.perf_counter()
+        self.thread = threading.get_ident()
+        self._stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.totals[parent[0]] += now - parent[1]
+        entry = [name, now]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._stack.pop()
+            self.totals[name] = self.totals.get(name, 0.0) + now - entry[1]
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def report(self):
+        wall = time.perf_counter() - self.start
+        lines = []
+        for name, total in self.totals.items():
+            lines.append(
+                "{:>10s} {:10.3f}s {:5.1f}% ({} calls)".format(
+                    name, total, 100 * total / wall if wall else 0, self.counts[name]
+                )
+            )
+        other = wall - sum(self.totals.values())
+        lines.append("{:>10s} {:10.3f}s".format("other", other))
+        lines.append("{:>10s} {:10.3f}s".format("wall", wall))
+        return "\n".join(lines)
+
+
+def phase(name):
+    if timer is None or timer.thread != threading.get_ident():
+        return _NULL_PHASE
+    return timer.phase(name)
+
+
+def is_enabled(args):
+    if args is not None and getattr(args, "profile", False):
+        return True
+    return os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes")
+
+
+def _time_handlers(log):
+    """Charge time spent in log handlers to the logging phase."""
+
+    def timed(handle):
+        def wrapper(record):
+            with phase("logging"):
+                return handle(record)
+
+        return wrapper
+
+    for handler in log.handlers:
+        handler.handle = timed(handler.handle)
+
+
+def profile(name, out_dir, func, *args):
+    """Run func(*args) under cProfile, writing out_dir/<name>.pstats."""
+    global timer
+    timer = PhaseTimer()
+    _time_handlers(logging.getLogger())
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(func, *args)
+    finally:
+        pstats_file = os.path.join(out_dir, "{}.pstats".format(name))
+        profiler.dump_stats(pstats_file)
+        logger.info("Phase breakdown for queue %s:\n%s", name, timer.report())
+        logger.info("Wrote profile for queue %s to %s", name, pstats_file)
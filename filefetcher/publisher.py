@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Move retrieved files into the archive.
+
+By default files are renamed into out_dir as soon as they are retrieved. If
+$FF_SPOOL_DIR is set, a finished file is instead renamed into a spool on fast
+local storage and a small pool of threads copies it into the archive, so a
+slow archive doesn't hold up the next transfer. The spool is laid out as
+<spool>/<queue>/<absolute out path>, so anything left behind by an earlier
+run is picked up again when its queue next starts.
+"""
+
+import errno
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+SPOOL_DIR_ENV = "FF_SPOOL_DIR"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_DEPTH = 16
+DEFAULT_RETRIES = 3
+RETRY_DELAY = 5  # seconds, doubled after each failure
+
+logger = logging.getLogger(__name__)
+made_dirs = set()
+
+
+def make_out_dir(dir):
+    if dir in made_dirs:
+        return
+
+    try:
+        os.makedirs(dir)
+        logger.info("Created %s", dir)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    made_dirs.add(dir)
+
+
+class Publisher:
+    """Copy spooled files into the archive on a pool of worker threads.
+
+    submit() blocks once depth files are waiting, which keeps the spool from
+    growing without bound if the archive falls behind.
+    """
+
+    def __init__(
+        self, spool_dir, workers=DEFAULT_WORKERS, depth=DEFAULT_QUEUE_DEPTH,
+        retries=DEFAULT_RETRIES,
+    ):
+        self.spool_dir = spool_dir
+        self.retries = retries
+        self.queue = queue.Queue(maxsize=depth)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._work, name="publisher-{}".format(i), daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def spool_path(self, out_file):
+        return os.path.join(self.spool_dir, os.path.abspath(out_file).lstrip(os.sep))
+
+    def is_pending(self, out_file):
+        with self.lock:
+            return str(out_file) in self.pending
+
+    def submit(self, tmp_path, out_file, callback=None):
+        """Move a finished temp file into the spool and queue it.
+
+        callback, if given, is called with out_file once it is published.
+        """
+        out_file = str(out_file)
+        spool_file = self.spool_path(out_file)
+        make_out_dir(os.path.dirname(spool_file))
+        shutil.move(str(tmp_path), spool_file)
+        self._enqueue(spool_file, out_file, callback)
+
+    def _enqueue(self, spool_file, out_file, callback=None):
+        with self.lock:
+            self.pending.add(out_file)
+        self.queue.put((spool_file, out_file, callback))
+
+    def recover(self, callback_for=None):
+        """Queue files left in the spool by an earlier run.
+
+        callback_for, if given, is called with each recovered out_file and
+        returns the callback to pass to submit() for it, or None.
+        """
+        for root, dirs, files in os.walk(self.spool_dir):
+            for file in files:
+                spool_file = os.path.join(root, file)
+                rel_path = os.path.relpath(spool_file, self.spool_dir)
+                out_file = os.path.join(os.sep, rel_path)
+                logger.info("Recovering %s from spool", out_file)
+                callback = None if callback_for is None else callback_for(out_file)
+                self._enqueue(spool_file, out_file, callback)
+
+    def _publish(self, spool_file, out_file):
+        make_out_dir(os.path.dirname(out_file))
+        try:
+            os.rename(spool_file, out_file)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+        part_file = "{}.part".format(out_file)
+        shutil.copyfile(spool_file, part_file)
+        os.rename(part_file, out_file)
+        os.remove(spool_file)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            spool_file, out_file, callback = item
+            delay = RETRY_DELAY
+            published = False
+            for attempt in range(self.retries + 1):
+                try:
+                    self._publish(spool_file, out_file)
+                    logger.debug("Published %s", out_file)
+                    published = True
+                    break
+                except OSError as e:
+                    if attempt == self.retries:
+                        logger.error(
+                            "Cannot publish %s, leaving it in the spool: %s",
+                            out_file,
+                            e,
+                        )
+                    else:
+                        logger.info("Cannot publish %s, will retry: %s", out_file, e)
+                        time.sleep(delay)
+                        delay *= 2
+
+            with self.lock:
+                self.pending.discard(out_file)
+            if published and callback is not None:
+                callback(out_file)
+            self.queue.task_done()
+
+    def close(self):
+        """Wait for queued files to be published and stop the workers."""
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
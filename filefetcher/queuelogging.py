@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Keep logging off the hot path of queue processes.
+
+start() moves the handlers configured by tomputils onto a QueueListener in
+the parent process and replaces them with a single QueueHandler. Queue
+processes inherit that handler when they fork, so logging a record costs a
+filter, a format and a put on a multiprocessing.Queue; the pickling and the
+write to the pipe happen on the queue's feeder thread and all I/O happens in
+the parent.
+
+Behaviour is controlled by environment variables:
+
+  FF_LOG_LEVEL   root log level, DEBUG by default
+  FF_LOG_FORMAT  "text" (default) or "json" for one JSON object per line
+  FF_QUEUE_LOGS  if true, also write each queue's records to
+                 $FF_LOG_DIR/<queue>.log
+"""
+
+import copy
+from datetime import datetime
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+
+LOG_LEVEL_ENV = "FF_LOG_LEVEL"
+LOG_FORMAT_ENV = "FF_LOG_FORMAT"
+QUEUE_LOGS_ENV = "FF_QUEUE_LOGS"
+TEXT_FORMAT = (
+    "%(asctime)s %(levelname)s - %(message)s "
+    + "(%(filename)s:%(lineno)s PID %(process)d)"
+)
+
+queue_name = None
+
+
+class QueueNameFilter(logging.Filter):
+    """Tag each record with the name of the queue which produced it."""
+
+    def filter(self, record):
+        record.queue = queue_name
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "queue": getattr(record, "queue", None),
+            "pid": record.process,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler which keeps a record's traceback out of its message.
+
+    The stock prepare() folds the traceback into msg and drops exc_info, so
+    JsonFormatter could never report it separately. Here the traceback
+    travels in exc_text, which Formatter appends to text output as before.
+    """
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        prepared = copy.copy(record)
+        prepared.message = record.getMessage()
+        prepared.msg = prepared.message
+        prepared.args = None
+        prepared.exc_info = None
+        return prepared
+
+
+class PerQueueFileHandler(logging.Handler):
+    """Route records to one log file per queue, opening files as needed."""
+
+    def __init__(self, log_dir, formatter):
+        super().__init__()
+        self.log_dir = log_dir
+        self.setFormatter(formatter)
+        self.handlers = {}
+
+    def emit(self, record):
+        name = getattr(record, "queue", None)
+        if name is None:
+            return
+
+        handler = self.handlers.get(name)
+        if handler is None:
+            log_file = os.path.join(self.log_dir, "{}.log".format(name))
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(self.formatter)
+            self.handlers[name] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+def _is_true(value):
+    return value.lower() in ("1", "true", "yes")
+
+
+def start(log):
+    """Replace log's handlers with a QueueHandler and return the listener."""
+    level = os.environ.get(LOG_LEVEL_ENV, "DEBUG").upper()
+    log.setLevel(level)
+
+    handlers = list(log.handlers)
+    if os.environ.get(LOG_FORMAT_ENV, "text").lower() == "json":
+        formatter = JsonFormatter()
+        for handler in handlers:
+            if type(handler) is logging.StreamHandler:
+                handler.setFormatter(formatter)
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    for handler in handlers:
+        log.removeHandler(handler)
+
+    if _is_true(os.environ.get(QUEUE_LOGS_ENV, "false")):
+        log_dir = os.environ.get("FF_LOG_DIR", ".")
+        handlers.append(PerQueueFileHandler(log_dir, formatter))
+
+    queue = multiprocessing.Queue(-1)
+    queue_handler = QueueHandler(queue)
+    queue_handler.addFilter(QueueNameFilter())
+    log.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(
+        queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    return listener
+
+
+def set_queue_name(name):
+    """Called once by each queue process to tag its records."""
+    global queue_name
+    queue_name = name
+
+
+def stop(listener):
+    """Drain outstanding records. logging.shutdown() closes the handlers."""
+    listener.stop()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Move bytes from a remote datalogger to a local file.
+
+A transport knows how to perform a single transfer. Everything else -- temp
+files, resuming, renaming and deciding what to fetch next -- stays in
+filefetcher.py so that the scheduling logic can be exercised against
+FakeTransport without a network. pycurl is only imported once a real
+transfer starts.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+import io
+import logging
+import random
+import re
+import socket
+import struct
+import sys
+import time
+from urllib.parse import urlparse
+
+import tomputils.util as tutil
+
+from filefetcher import period
+
+WINDOW_SIZE_FACTOR = 2
+MAX_UPDATE_FREQ = 10  # seconds
+SCHEDULE_CHECK_FREQ = 60  # seconds
+
+# libcurl error codes used by FakeTransport
+CURLE_REMOTE_FILE_NOT_FOUND = 78
+
+# libcurl error codes which mean a remote file or directory isn't there
+NOT_FOUND_ERRORS = {9, 37, CURLE_REMOTE_FILE_NOT_FOUND}
+
+# libcurl's error for an HTTP status of 400 or more with FAILONERROR set
+CURLE_HTTP_RETURNED_ERROR = 22
+
+HTTP_SCHEMES = {"http", "https"}
+
+# Schemes whose directory listings give file sizes
+LISTING_SCHEMES = {"ftp", "ftps", "sftp"}
+LISTING_PATTERNS = [
+    # -rw-r--r--   1 owner group     12345 Oct 19 12:00 name
+    re.compile(r"-\S{9}\S*\s+\d+\s+(?:\S+\s+){1,2}(\d+)\s+\w{3}\s+\d+\s+\S+\s(.+)"),
+    # 10-19-26  12:00PM     12345 name
+    re.compile(r"\d\d-\d\d-\d\d(?:\d\d)?\s+\d+:\d\d[AP]M\s+(\d+)\s(.+)"),
+]
+
+logger = logging.getLogger(__name__)
+
+
+class TransportError(Exception):
+    """A transfer failed. args[0] is a libcurl error code, args[1] a message."""
+
+
+class Transport(ABC):
+    """Interface implemented by all transports."""
+
+    @abstractmethod
+    def fetch(self, datalogger, url, out, offset=0, resume=True):
+        """Write the remote file at url to the open file out.
+
+        If offset is non-zero, only bytes from offset onward are requested.
+        resume says whether an interrupted transfer may pick up where it
+        stopped; if not, out is emptied and the transfer starts over.
+        Raises TransportError on failure.
+        """
+
+    @abstractmethod
+    def sizes(self, datalogger, urls):
+        """Sizes in bytes of the remote files at urls, keyed by url.
+
+        Files which aren't there are left out. Where it can, a transport
+        lists each remote directory once rather than asking about each file.
+        Raises TransportError on failure.
+        """
+
+
+def parse_listing(listing):
+    """File names and sizes from a Unix or Windows style directory listing."""
+    sizes = {}
+    for line in listing.splitlines():
+        for pattern in LISTING_PATTERNS:
+            match = pattern.fullmatch(line.strip())
+            if match:
+                sizes[match.group(2).strip()] = int(match.group(1))
+                break
+    return sizes
+
+
+def recv_speed(datalogger, now=None):
+    """Return the receive speed in effect for datalogger at local time now.
+
+    recvSchedule is a list of {start, end, speed} entries with times in %H:%M
+    form. An entry whose end is before its start spans midnight, an entry
+    without times always matches. The first matching entry wins; if none
+    match, recvSpeed applies.
+    """
+    schedule = datalogger.get("recvSchedule")
+    if schedule:
+        if now is None:
+            now = datetime.now().time()
+        for entry in schedule:
+            if "start" not in entry:
+                return entry["speed"]
+
+            start = datetime.strptime(entry["start"], "%H:%M").time()
+            end = datetime.strptime(entry["end"], "%H:%M").time()
+            if start <= end:
+                if start <= now < end:
+                    return entry["speed"]
+            elif now >= start or now < end:
+                return entry["speed"]
+
+    return datalogger.get("recvSpeed", 0)
+
+
+def setRecvSpeed(curl, speed):
+    if speed < 1:
+        return
+
+    def sockoptfunction(curlfd, purpose):
+        logger.debug("Setting RECV_SPEED to %s b/s", speed)
+        sock = socket.socket(fileno=curlfd)
+
+        window_size = speed * WINDOW_SIZE_FACTOR
+        if sys.maxsize > 2 ** 32:
+            size = struct.pack(str("ll"), int(window_size), int(0))
+        else:
+            size = struct.pack(str("ii"), int(window_size), int(0))
+
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        sock.detach()
+        return 0
+
+    curl.setopt(curl.SOCKOPTFUNCTION, sockoptfunction)
+    curl.setopt(curl.MAX_RECV_SPEED_LARGE, speed)
+    curl.setopt(curl.BUFFERSIZE, speed * WINDOW_SIZE_FACTOR)
+
+
+def create_curl(datalogger, url, speed=0):
+    import pycurl
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    c = pycurl.Curl()
+    c.setopt(c.VERBOSE, debug)
+    if "userpwd" in datalogger:
+        userpwd = tutil.get_env_var(datalogger["userpwd"], secret=True)
+        logger.debug("Setting userpw to whatever is in $%s", datalogger["userpwd"])
+        c.setopt(pycurl.USERPWD, userpwd)
+
+    setRecvSpeed(c, speed)
+
+    if "port" in datalogger:
+        c.setopt(pycurl.PORT, datalogger["port"])
+
+    scheduled = "recvSchedule" in datalogger
+    last_update = last_check = time.monotonic()
+
+    def progress(download_t, download_d, upload_t, upload_d):
+        nonlocal last_update, last_check
+        now = time.monotonic()
+        if debug and now > last_update + MAX_UPDATE_FREQ:
+            import humanize
+
+            download_d_str = humanize.naturalsize(download_d, format="%.2f")
+            download_t_str = humanize.naturalsize(download_t, format="%.2f")
+            logger.debug(
+                "Downloaded %s of %s from %s", download_d_str, download_t_str, url
+            )
+            last_update = now
+        if scheduled and now > last_check + SCHEDULE_CHECK_FREQ:
+            last_check = now
+            if recv_speed(datalogger) != speed:
+                # pycurl won't setopt() mid-transfer; abort and reconnect.
+                return 1
+        return 0
+
+    if "low_speed_limit" in datalogger:
+        logger.info(
+            "Setting low speed limit to %db/s over %ds",
+            datalogger["low_speed_limit"],
+            datalogger["low_speed_time"],
+        )
+        c.setopt(c.LOW_SPEED_LIMIT, datalogger["low_speed_limit"])
+        c.setopt(c.LOW_SPEED_TIME, datalogger["low_speed_time"])
+
+    if debug or scheduled:
+        c.setopt(c.NOPROGRESS, False)
+        c.setopt(c.XFERINFOFUNCTION, progress)
+    c.setopt(c.URL, url)
+
+    return c
+
+
+def range_writer(curl, url, out):
+    """Set up curl to write a ranged request to out, noticing ignored ranges.
+
+    An HTTP server which doesn't do ranges answers with 200 and the whole
+    file, so out is emptied before the first write. Error responses never
+    get here since the request is made with FAILONERROR. pycurl won't
+    getinfo() mid-transfer, so the status line is read from the headers.
+    """
+    status = None
+    checked = urlparse(url).scheme not in HTTP_SCHEMES
+
+    def header(line):
+        nonlocal status
+        if line.startswith(b"HTTP/"):
+            status = int(line.split()[1])
+
+    def write(data):
+        nonlocal checked
+        if not checked:
+            checked = True
+            if status == 200:
+                logger.info("%s ignored the range, starting over", url)
+                out.seek(0)
+                out.truncate()
+        out.write(data)
+
+    curl.setopt(curl.HEADERFUNCTION, header)
+    curl.setopt(curl.WRITEFUNCTION, write)
+
+
+class CurlTransport(Transport):
+    """The real thing: one pycurl handle per transfer.
+
+    If the datalogger's receive speed changes while a transfer is running, the
+    transfer is stopped and resumed from where it left off at the new speed,
+    or started over if resume is false.
+    """
+
+    def fetch(self, datalogger, url, out, offset=0, resume=True):
+        import pycurl
+
+        while True:
+            speed = recv_speed(datalogger)
+            c = create_curl(datalogger, url, speed)
+            if offset > 0:
+                c.setopt(c.RANGE, "{}-".format(offset))
+                c.setopt(c.FAILONERROR, True)
+                range_writer(c, url, out)
+            else:
+                c.setopt(c.WRITEDATA, out)
+            try:
+                c.perform()
+                return
+            except pycurl.error as e:
+                if offset > 0 and c.getinfo(pycurl.RESPONSE_CODE) == 416:
+                    logger.info("Nothing after byte %d of %s", offset, url)
+                    return
+                new_speed = recv_speed(datalogger)
+                if e.args[0] != pycurl.E_ABORTED_BY_CALLBACK or new_speed == speed:
+                    raise TransportError(*e.args) from e
+                if resume:
+                    offset = out.tell()
+                else:
+                    out.seek(0)
+                    out.truncate()
+                    offset = 0
+                logger.info(
+                    "Receive speed for %s now %d b/s, restarting at byte %d",
+                    datalogger["name"],
+                    new_speed,
+                    offset,
+                )
+            finally:
+                c.close()
+
+    def sizes(self, datalogger, urls):
+        import pycurl
+
+        if not urls:
+            return {}
+
+        c = create_curl(datalogger, urls[0], recv_speed(datalogger))
+        c.setopt(c.FAILONERROR, True)
+        sizes = {}
+        try:
+            if urlparse(urls[0]).scheme in LISTING_SCHEMES:
+                dirs = {url.rsplit("/", 1)[0] + "/" for url in urls}
+                for dir_url in sorted(dirs):
+                    listing = io.BytesIO()
+                    c.setopt(c.URL, dir_url)
+                    c.setopt(c.WRITEDATA, listing)
+                    if not self._perform(c, dir_url):
+                        continue
+                    text = listing.getvalue().decode("utf-8", "replace")
+                    for name, size in parse_listing(text).items():
+                        sizes[dir_url + name] = size
+                return {url: sizes[url] for url in urls if url in sizes}
+
+            # No sizes in the listing, ask about each file on the same handle.
+            c.setopt(c.NOBODY, True)
+            for url in urls:
+                c.setopt(c.URL, url)
+                if self._perform(c, url):
+                    size = c.getinfo(pycurl.CONTENT_LENGTH_DOWNLOAD)
+                    if size >= 0:
+                        sizes[url] = int(size)
+            return sizes
+        finally:
+            c.close()
+
+    def _perform(self, c, url):
+        """Perform, returning False if url isn't there."""
+        import pycurl
+
+        try:
+            c.perform()
+            return True
+        except pycurl.error as e:
+            not_found = e.args[0] in NOT_FOUND_ERRORS
+            if e.args[0] == CURLE_HTTP_RETURNED_ERROR:
+                not_found = c.getinfo(pycurl.RESPONSE_CODE) == 404
+            if not_found:
+                logger.debug("%s not found: %s", url, e.args[1])
+                return False
+            raise TransportError(*e.args) from e
+
+
+class FakeHost:
+    """Behaviour of a simulated datalogger.
+
+    latency is seconds per transfer, bandwidth is bytes per second, size is
+    the daily file size in bytes. missing_rate and error_rate are the
+    probability that a given day's file is absent or that its transfer fails
+    with one of the transport's error codes. If installed is given, files
+    for periods before it are absent, as they would be on a real datalogger.
+    """
+
+    def __init__(
+        self, latency=0.5, bandwidth=8192, size=1_000_000, missing_rate=0.0,
+        error_rate=0.0, installed=None,
+    ):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.size = size
+        self.missing_rate = missing_rate
+        self.error_rate = error_rate
+        self.installed = installed
+
+    def has_file(self, datalogger, url):
+        """Was the datalogger installed by the period url names?"""
+        if self.installed is None:
+            return True
+        when = period.match_time(period.path_regex(datalogger, "url"), url)
+        return when is None or when >= self.installed
+
+
+class FakeTransport(Transport):
+    """Deterministic in-memory transport for simulation.
+
+    No bytes are moved and nothing sleeps. Each transfer advances a simulated
+    per-host clock by latency + size / bandwidth, where bandwidth is capped by
+    the datalogger's current receive speed. Outcomes are a pure function of
+    seed and URL, so repeated runs see the same missing files and errors.
+
+    hosts maps a host name to a FakeHost; anything else gets default.
+    error_codes defaults to $PYCURL_MINOR_ERRORS.
+    """
+
+    def __init__(self, hosts=None, default=None, error_codes=None, seed=0):
+        self.hosts = hosts or {}
+        self.default = default or FakeHost()
+        if error_codes is None:
+            error_codes = tutil.get_env_var("PYCURL_MINOR_ERRORS").split(",")
+        self.error_codes = [int(code) for code in error_codes]
+        self.seed = seed
+        self.clock = {}
+        self.transfers = 0
+        self.bytes = 0
+
+    def host(self, url):
+        return urlparse(url).hostname
+
+    def elapsed(self, host):
+        """Simulated seconds spent talking to host."""
+        return self.clock.get(host, 0.0)
+
+    def fetch(self, datalogger, url, out, offset=0, resume=True):
+        host = self.host(url)
+        spec = self.hosts.get(host, self.default)
+        rng = random.Random("{}:{}".format(self.seed, url))
+        self.transfers += 1
+        self.clock[host] = self.clock.get(host, 0.0) + spec.latency
+
+        missing = rng.random() < spec.missing_rate
+        if missing or not spec.has_file(datalogger, url):
+            raise TransportError(CURLE_REMOTE_FILE_NOT_FOUND, "Remote file not found")
+
+        if rng.random() < spec.error_rate:
+            code = rng.choice(self.error_codes)
+            raise TransportError(code, "Simulated error {}".format(code))
+
+        bandwidth = spec.bandwidth
+        speed = recv_speed(datalogger)
+        if 0 < speed < bandwidth:
+            bandwidth = speed
+
+        remaining = max(spec.size - offset, 0)
+        self.clock[host] += remaining / bandwidth
+        self.bytes += remaining
+
+    def sizes(self, datalogger, urls):
+        sizes = {}
+        dirs = set()
+        for url in urls:
+            host = self.host(url)
+            spec = self.hosts.get(host, self.default)
+            dir_url = url.rsplit("/", 1)[0]
+            if (host, dir_url) not in dirs:
+                dirs.add((host, dir_url))
+                self.clock[host] = self.clock.get(host, 0.0) + spec.latency
+
+            rng = random.Random("{}:{}".format(self.seed, url))
+            if rng.random() >= spec.missing_rate and spec.has_file(datalogger, url):
+                sizes[url] = spec.size
+        return sizes
@@ -32,8 +32,8 @@ setup(
         "pycurl",
         "tomputils>=1.12.4",
         "humanize",
-        "multiprocessing-logging",
         "jinja2",
+        "numpy",
         "psutil",
         "single",
     ],
@@ -42,6 +42,7 @@ setup(
             "filefetcher = filefetcher.filefetcher:main",
             "dailyreport = filefetcher.dailyreport:main",
             "fetcherreaper = filefetcher.fetcherreaper:main",
+            "fetcheraudit = filefetcher.audit:main",
         ]
     },
 )
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Measure filefetcher scheduling overhead against a simulated network.
+
+Builds a synthetic config of many dataloggers, each backfilling a year to the
+day it was installed, and runs every queue through filefetcher.poll_queue
+using FakeTransport. Queues run one after another in this process so that
+wall-clock time measures
+filefetcher's own overhead (templates, presence checks, temp files, renames,
+locks) rather than process scheduling. Simulated time is reported as it would
+be in production, with queues running concurrently.
+
+Files are zero-length but really are written, so point --work-dir at a tmpfs
+for the larger runs.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import tomputils.util as tutil
+
+import filefetcher.filefetcher as ff
+from filefetcher.transport import FakeHost, FakeTransport
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--loggers", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queues", type=int, default=100)
+    parser.add_argument("--period", default="1d")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--bandwidth", type=int, default=8192)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--recv-speed", type=int, default=640)
+    parser.add_argument("--missing-rate", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--error-codes", default="7,9,28,78")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Where to write files.")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def backfill_date(args):
+    return datetime.combine(
+        datetime.utcnow().date() - timedelta(args.days), datetime.min.time()
+    )
+
+
+def build_config(args, out_dir):
+    backfill = backfill_date(args)
+    queues = []
+    for q in range(args.queues):
+        queues.append({"name": "queue{:04d}".format(q), "dataloggers": []})
+
+    for i in range(args.loggers):
+        datalogger = {
+            "name": "L{:05d}".format(i),
+            "address": "host{:05d}".format(i),
+            "url": "ftp://${address}/%Y%m/${name}%Y%m%d%H%M${session}.T00",
+            "out_dir": out_dir,
+            "out_path": "${name}/%Y/%j/${name}%j${session}%M.%y_",
+            "period": args.period,
+            "backfill": backfill.strftime("%m/%d/%Y"),
+            "partial_downloads": True,
+            "recvSpeed": args.recv_speed,
+        }
+        queues[i % args.queues]["dataloggers"].append(datalogger)
+
+    return {"queues": queues}
+
+
+def main():
+    args = arg_parse()
+    logger = tutil.setup_logging("benchmark_scale errors")
+    logger.setLevel(args.log_level)
+
+    work_dir = tempfile.mkdtemp(dir=args.work_dir)
+    out_dir = os.path.join(work_dir, "out")
+    tmp_dir = os.path.join(work_dir, "tmp")
+    os.makedirs(tmp_dir)
+    os.environ["FF_TMP_DIR"] = tmp_dir
+    os.environ["PYCURL_MINOR_ERRORS"] = args.error_codes
+
+    host = FakeHost(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        size=args.size,
+        missing_rate=args.missing_rate,
+        error_rate=args.error_rate,
+        installed=backfill_date(args),
+    )
+    transport = FakeTransport(default=host, seed=args.seed)
+    config = build_config(args, out_dir)
+
+    ff.logger = logger
+    ff.args = argparse.Namespace(no_backfill=False)
+    ff.global_config = config
+    ff.transport = transport
+
+    queue_times = []
+    start = time.perf_counter()
+    try:
+        for queue in config["queues"]:
+            ff.poll_queue(queue)
+            hosts = [d["address"] for d in queue["dataloggers"]]
+            queue_times.append(sum(transport.elapsed(h) for h in hosts))
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    items = transport.transfers
+    print("dataloggers:          {}".format(args.loggers))
+    print("queues:               {}".format(args.queues))
+    print("transfers attempted:  {}".format(items))
+    print("bytes simulated:      {}".format(transport.bytes))
+    print("scheduling wall time: {:.2f}s".format(wall))
+    print("overhead per item:    {:.1f}us".format(1e6 * wall / max(items, 1)))
+    print("simulated wall time:  {}".format(timedelta(seconds=max(queue_times))))
+    print("simulated link time:  {}".format(timedelta(seconds=sum(queue_times))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# I waive copyright and related rights in the this work worldwide
+# through the CC0 1.0 Universal public domain dedication.
+# https://creativecommons.org/publicdomain/zero/1.0/legalcode
+#
+# Author(s):
+#   Tom Parker <tparker@usgs.gov>
+
+""" Measure how long each console script takes to start.
+
+Cron runs these scripts often, so time from starting the interpreter to
+being ready for work matters. Each script is run repeatedly in a fresh
+interpreter with nothing to do: filefetcher with its only queue locked by
+this process, fetcherreaper with no lock files, and dailyreport and
+fetcheraudit with --help. Plain imports of each module and of nothing at all
+are timed as well, to show where the time goes.
+"""
+
+import argparse
+import fcntl
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIG = """
+queues:
+  - name: benchmark
+    dataloggers:
+      - name: BENCH
+        url: file:///nonexistent/%Y%m%d.dat
+        out_dir: {out_dir}
+        out_path: "%Y%m%d.dat"
+"""
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=20)
+    return parser.parse_args()
+
+
+def commands():
+    python = sys.executable
+    return [
+        ("python", [python, "-c", "pass"]),
+        ("import filefetcher", [python, "-c", "import filefetcher"]),
+        (
+            "import filefetcher.filefetcher",
+            [python, "-c", "import filefetcher.filefetcher"],
+        ),
+        (
+            "import filefetcher.dailyreport",
+            [python, "-c", "import filefetcher.dailyreport"],
+        ),
+        (
+            "import filefetcher.fetcherreaper",
+            [python, "-c", "import filefetcher.fetcherreaper"],
+        ),
+        ("import filefetcher.audit", [python, "-c", "import filefetcher.audit"]),
+        ("filefetcher", [python, "-m", "filefetcher.filefetcher"]),
+        ("dailyreport --help", [python, "-m", "filefetcher.dailyreport", "--help"]),
+        ("fetcherreaper", [python, "-m", "filefetcher.fetcherreaper"]),
+        ("fetcheraudit --help", [python, "-m", "filefetcher.audit", "--help"]),
+    ]
+
+
+def time_command(command, env, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            command,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    args = arg_parse()
+    with tempfile.TemporaryDirectory() as work_dir:
+        tmp_dir = os.path.join(work_dir, "tmp")
+        os.makedirs(tmp_dir)
+        config_file = os.path.join(work_dir, "config.yaml")
+        with open(config_file, "w") as f:
+            f.write(CONFIG.format(out_dir=work_dir))
+
+        env = dict(os.environ)
+        for var in ("MAILHOST", "LOG_SENDER", "LOG_RECIPIENT"):
+            env.pop(var, None)
+        env["FF_CONFIG"] = config_file
+        env["FF_TMP_DIR"] = tmp_dir
+        env["REPORT_RECIPIENT"] = "nobody@example.com"
+
+        # Hold the queue's lock so filefetcher has nothing to do. The lock
+        # file lives outside tmp_dir, so fetcherreaper finds nothing either.
+        lock_dir = os.path.join(work_dir, "lock")
+        os.makedirs(lock_dir)
+        lock_fd = os.open(os.path.join(lock_dir, "benchmark.lock"), os.O_CREAT)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+        print("{:34} {:>9} {:>9}".format("", "min ms", "median ms"))
+        for name, command in commands():
+            run_env = env
+            if name == "filefetcher":
+                run_env = dict(env, FF_TMP_DIR=lock_dir)
+            times = time_command(command, run_env, args.runs)
+            print(
+                "{:34} {:9.1f} {:9.1f}".format(
+                    name, 1000 * min(times), 1000 * statistics.median(times)
+                )
+            )
+        os.close(lock_fd)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,30 +7,99 @@
 # Author(s):
 #   Tom Parker <tparker@usgs.gov>
 
-""" Reorganise files to accomodate a new out_path. Cannot be used to
-    acoommodate a changed out_path. """
+""" Reorganise files to accomodate a new out_path.
 
-from datetime import timedelta, datetime
+Files are found using the datalogger's old_out_path, if it has one, or else
+by the file name in its url anywhere below out_dir/${name}, which is where
+older versions of filefetcher put them. Each file is moved to where out_path
+says it belongs.
+
+The whole archive is scanned and a plan is made before anything is moved.
+Moves which would overwrite an existing file, or which would move two files
+to the same place, are reported and left out. With --dry-run the plan is
+logged and nothing else happens. Otherwise moves run on a pool of worker
+threads and each completed move is appended to a journal, so an interrupted
+migration can be run again and will pick up where it left off.
+"""
+
+import argparse
+import errno
 import logging
 import os
-import sys
-import socket
-import struct
-import pycurl
 import pathlib
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from string import Template
+
 import ruamel.yaml
-from urllib.parse import urlparse
-import errno
-from multiprocessing import Process
 import tomputils.util as tutil
-from string import Template
-import shutil
+
+from filefetcher import archivescan, period
+from filefetcher.publisher import make_out_dir
+
+DEFAULT_WORKERS = 8
+DEFAULT_JOURNAL = "urltooutpath.journal"
 
 global global_config
 
 
+class Journal:
+    """Record completed moves, one tab-separated line each."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def done(self):
+        """Sources of moves recorded by earlier runs."""
+        try:
+            with open(self.path) as f:
+                return {line.split("\t")[0] for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def record(self, old_path, new_path):
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write("{}\t{}\n".format(old_path, new_path))
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def arg_parse():
+    description = "I move archived files to where their out_path says they belong."
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Log the plan without moving anything.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--journal",
+        help="Where should I record completed moves?",
+        default=DEFAULT_JOURNAL,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="How many files should I move at once?",
+        type=int,
+        default=DEFAULT_WORKERS,
+    )
+    return parser.parse_args()
+
+
 def parse_config():
-    config_file = pathlib.Path(tutil.get_env_var('FF_CONFIG_FILE'))
+    config_file = pathlib.Path(tutil.get_env_var("FF_CONFIG_FILE"))
     yaml = ruamel.yaml.YAML()
     global global_config
     try:
@@ -46,41 +115,129 @@ def parse_config():
             raise
 
 
-def process_logger(datalogger):
-    if 'out_path' not in datalogger:
-        logging.info("Skipping %s, no out_path", datalogger['name'])
-        return
-
-    os.chdir(datalogger['out_dir'])
-    src_path = datalogger['name']
-    old_format = datalogger['url'].split('/', 3)[3]
-    old_file_format = datalogger['url'].split('/')[-1]
-    logger.debug("Processing logger %s with format %s", datalogger['name'],
-                 old_format)
-    for root, dirs, files in os.walk(src_path):
-        for file in files:
-            try:
-                date = datetime.strptime(file, old_file_format)
-            except ValueError:
-                continue
-            out_str = Template(str(old_file_format)).substitute(datalogger)
-            date = datetime.strptime(file, out_str)
-            logger.debug("Found %s date %s", file, date)
-
-            old_path = os.path.join(root, file)
-            new_fmt = Template(datalogger['out_path']).substitute(datalogger)
-            new_path = date.strftime(new_fmt)
-
-            logger.info("Moving %s to %s", old_path , new_path)
-            try:
-                os.makedirs(os.path.dirname(new_path))
-            except FileExistsError:
-                pass
-            shutil.move(old_path, new_path)
+def source_pattern(datalogger):
+    """Directory to search, regex to match and whether to match file names.
+
+    Without an old_out_path, file names are matched against the file name
+    in the datalogger's url.
+    """
+    out_dir = datalogger["out_dir"]
+    if "old_out_path" in datalogger:
+        prefix = os.path.dirname(period.path_prefix(datalogger, "old_out_path"))
+        regex = period.path_regex(datalogger, "old_out_path")
+        return os.path.join(out_dir, prefix), regex, False
+
+    file_format = datalogger["url"].split("/")[-1]
+    pattern = Template(file_format).substitute(
+        datalogger, session=period.SESSION_MARK
+    )
+    regex = period.compile_pattern(pattern)
+    return os.path.join(out_dir, datalogger["name"]), regex, True
+
+
+def plan_logger(datalogger, source, snapshot):
+    """Moves needed to put the datalogger's files where out_path says."""
+    out_dir = datalogger["out_dir"]
+    root, regex, by_name = source
+    moves = []
+    for old_path in snapshot.new_files(root):
+        if by_name:
+            name = os.path.basename(old_path)
+        else:
+            name = os.path.relpath(old_path, out_dir)
+        when = period.match_time(regex, name)
+        if when is None:
+            continue
+
+        out_path = period.expand(datalogger, "out_path", when)
+        new_path = os.path.normpath(os.path.join(out_dir, out_path))
+        if new_path != old_path:
+            moves.append((old_path, new_path))
+
+    logger.info("%s: %d files to move", datalogger["name"], len(moves))
+    return moves
+
+
+def find_conflicts(moves, snapshot):
+    """Split moves into those which are safe and those which are not."""
+    targets = Counter(new_path for old_path, new_path in moves)
+    safe = []
+    conflicts = []
+    for old_path, new_path in moves:
+        if snapshot.exists(new_path):
+            conflicts.append((old_path, new_path, "destination exists"))
+        elif targets[new_path] > 1:
+            conflicts.append((old_path, new_path, "destination shared"))
+        else:
+            safe.append((old_path, new_path))
+
+    return safe, conflicts
+
+
+def make_plan(dataloggers, workers):
+    sources = []
+    roots = set()
+    for datalogger in dataloggers:
+        try:
+            source = source_pattern(datalogger)
+        except ValueError as e:
+            logger.error("Skipping %s: %s", datalogger["name"], e)
+            continue
+        sources.append((datalogger, source))
+        roots.add(source[0])
+        prefix = os.path.dirname(period.path_prefix(datalogger, "out_path"))
+        roots.add(os.path.join(datalogger["out_dir"], prefix))
+    snapshot = archivescan.scan(roots, workers)
+
+    moves = []
+    for datalogger, source in sources:
+        moves.extend(plan_logger(datalogger, source, snapshot))
+    return find_conflicts(moves, snapshot)
+
+
+def move_file(old_path, new_path):
+    make_out_dir(os.path.dirname(new_path))
+    try:
+        os.rename(old_path, new_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(old_path, new_path)
+
+
+def run_plan(moves, journal, workers):
+    """Move files on a pool of worker threads, journaling each move."""
+    failures = 0
+    slots = threading.BoundedSemaphore(workers * 4)
+
+    def work(old_path, new_path):
+        try:
+            move_file(old_path, new_path)
+            journal.record(old_path, new_path)
+            logger.debug("Moved %s to %s", old_path, new_path)
+            return True
+        except OSError:
+            logger.exception("Cannot move %s to %s", old_path, new_path)
+            return False
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for old_path, new_path in moves:
+            slots.acquire()
+            futures.append(pool.submit(work, old_path, new_path))
+        for future in futures:
+            if not future.result():
+                failures += 1
+
+    return failures
+
 
 def main():
     global logger
     logger = tutil.setup_logging("urltooutpath errors")
+    args = arg_parse()
 
     try:
         parse_config()
@@ -88,16 +245,40 @@ def main():
         msg = "Environment variable FF_CONFIG_FILE not set, exiting."
         tutil.exit_with_error(msg)
 
-    for queue in global_config['queues']:
+    dataloggers = []
+    for queue in global_config["queues"]:
+        for datalogger in queue["dataloggers"]:
+            if "out_path" in datalogger:
+                dataloggers.append(datalogger)
+            else:
+                logger.info("Skipping %s, no out_path", datalogger["name"])
+
+    moves, conflicts = make_plan(dataloggers, args.workers)
+    for old_path, new_path, reason in conflicts:
+        logger.warning("Not moving %s to %s: %s", old_path, new_path, reason)
+
+    journal = Journal(args.journal)
+    done = journal.done()
+    if done:
+        planned = len(moves)
+        moves = [move for move in moves if move[0] not in done]
+        skipped = planned - len(moves)
+        logger.info("Skipping %d moves already in %s", skipped, args.journal)
+
+    logger.info("%d files to move, %d conflicts", len(moves), len(conflicts))
+    if args.dry_run:
+        for old_path, new_path in moves:
+            logger.info("Would move %s to %s", old_path, new_path)
+    elif moves:
         try:
-            for datalogger in queue['dataloggers']:
-                process_logger(datalogger)
+            failures = run_plan(moves, journal, args.workers)
         finally:
-            logger.info("All done with queue %s.", queue['name'])
+            journal.close()
+        logger.info("Moved %d files, %d failed", len(moves) - failures, failures)
 
     logger.debug("That's all for now, bye.")
     logging.shutdown()
 
 
-if __name__ == '__main__':
+if __name__ == "__main__":
     main()
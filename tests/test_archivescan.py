@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from filefetcher import archivescan
+
+
+def touch(path, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    root = str(tmp_path / "archive")
+    touch(os.path.join(root, "A", "2020", "a1"), 100)
+    touch(os.path.join(root, "A", "2021", "a2"), 200)
+    touch(os.path.join(root, "B", "b1"), 300)
+    return root
+
+
+def test_scan(archive):
+    snapshot = archivescan.scan([archive], workers=2)
+
+    assert sorted(snapshot.mtimes) == [
+        os.path.join(archive, "A", "2020", "a1"),
+        os.path.join(archive, "A", "2021", "a2"),
+        os.path.join(archive, "B", "b1"),
+    ]
+    assert snapshot.exists(os.path.join(archive, "A", ".", "2020", "a1"))
+    assert not snapshot.exists(os.path.join(archive, "A", "2020"))
+
+
+def test_scan_missing_root(tmp_path):
+    assert archivescan.scan([str(tmp_path / "nothing")]).mtimes == {}
+
+
+def test_scan_follows_symlinked_directories(archive, tmp_path):
+    elsewhere = str(tmp_path / "elsewhere")
+    touch(os.path.join(elsewhere, "c1"))
+    os.symlink(elsewhere, os.path.join(archive, "C"))
+
+    snapshot = archivescan.scan([archive])
+
+    assert snapshot.exists(os.path.join(archive, "C", "c1"))
+
+
+def test_scan_stops_at_symlink_loops(archive):
+    os.symlink(archive, os.path.join(archive, "A", "2020", "loop"))
+    os.symlink(os.path.join(archive, "A"), os.path.join(archive, "B", "up"))
+
+    snapshot = archivescan.scan([archive])
+
+    # B/up leads to A, which isn't above B, so it is walked once more there.
+    assert sorted(os.path.relpath(path, archive) for path in snapshot.mtimes) == [
+        os.path.join("A", "2020", "a1"),
+        os.path.join("A", "2021", "a2"),
+        os.path.join("B", "b1"),
+        os.path.join("B", "up", "2020", "a1"),
+        os.path.join("B", "up", "2021", "a2"),
+    ]
+
+
+def test_scan_same_tree_through_two_roots(archive, tmp_path):
+    alias = str(tmp_path / "alias")
+    os.symlink(archive, alias)
+
+    snapshot = archivescan.scan([archive, alias])
+
+    assert snapshot.exists(os.path.join(archive, "B", "b1"))
+    assert snapshot.exists(os.path.join(alias, "B", "b1"))
+
+
+def test_recent(archive):
+    recent = archivescan.scan([archive]).recent(150)
+
+    assert sorted(recent.mtimes) == [
+        os.path.join(archive, "A", "2021", "a2"),
+        os.path.join(archive, "B", "b1"),
+    ]
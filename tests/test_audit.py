@@ -0,0 +1,51 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import filefetcher.filefetcher as ff
+from filefetcher import audit, period
+from filefetcher.transport import FakeHost, FakeTransport
+
+
+@pytest.fixture
+def datalogger(tmp_path, monkeypatch):
+    monkeypatch.setattr(audit, "logger", logging.getLogger("test"), raising=False)
+    transport = FakeTransport(default=FakeHost(size=100), error_codes=[7])
+    monkeypatch.setattr(ff, "transport", transport)
+    return {
+        "name": "TEST",
+        "address": "test.example.com",
+        "url": "ftp://${address}/${name}%Y%m%d.T00",
+        "out_dir": str(tmp_path),
+        "out_path": "${name}/${name}%Y%m%d.T00",
+    }
+
+
+def archive(datalogger, days_ago, size):
+    when = period.last_complete(datalogger) - days_ago * period.DAY
+    path = os.path.join(
+        datalogger["out_dir"], period.expand(datalogger, "out_path", when)
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_audit_logger_finds_short_files(datalogger):
+    archive(datalogger, 0, 100)
+    short = archive(datalogger, 1, 40)
+
+    with ThreadPoolExecutor(2) as pool:
+        mismatches = audit.audit_logger(datalogger, 3, pool)
+
+    assert [(str(out), local, remote) for url, out, local, remote in mismatches] == [
+        (short, 40, 100)
+    ]
+
+
+def test_audit_logger_no_days(datalogger):
+    with ThreadPoolExecutor(2) as pool:
+        assert audit.audit_logger(datalogger, 0, pool) == []
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from filefetcher import bitmap, period
+
+QUARTER = timedelta(minutes=15)
+
+
+def present(bits):
+    return np.array([bit == "1" for bit in bits], dtype=bool)
+
+
+def test_window_counts():
+    bits = present("1101011101")
+    counts = bitmap.window_counts(bits, {"last": 1, "three": 3, "all": 10})
+    assert counts == {"last": 1, "three": 2, "all": 7}
+
+
+@pytest.mark.parametrize("n, count", [(0, 0), (-5, 0), (100, 3)])
+def test_window_counts_clamps_windows(n, count):
+    assert bitmap.window_counts(present("10101"), {"window": n}) == {"window": count}
+
+
+def test_window_counts_empty_bitmap():
+    assert bitmap.window_counts(present(""), {"window": 7}) == {"window": 0}
+
+
+def test_missing_spans_most_recent_first():
+    end = datetime(2020, 1, 11)
+    spans = bitmap.missing_spans(present("0011011000"), end, period.DAY, 10)
+    assert spans == [
+        [datetime(2020, 1, 8), datetime(2020, 1, 10)],
+        [datetime(2020, 1, 5), datetime(2020, 1, 5)],
+        [datetime(2020, 1, 1), datetime(2020, 1, 2)],
+    ]
+
+
+def test_missing_spans_only_looks_at_limit():
+    end = datetime(2020, 1, 11)
+    spans = bitmap.missing_spans(present("0011011000"), end, period.DAY, 4)
+    assert spans == [[datetime(2020, 1, 8), datetime(2020, 1, 10)]]
+
+
+def test_missing_spans_splits_gap_at_limit():
+    end = datetime(2020, 1, 11)
+    spans = bitmap.missing_spans(present("0000000001"), end, period.DAY, 3)
+    assert spans == [[datetime(2020, 1, 8), datetime(2020, 1, 9)]]
+
+
+def test_missing_spans_none_missing():
+    end = datetime(2020, 1, 4)
+    assert bitmap.missing_spans(present("111"), end, period.DAY, 3) == []
+
+
+def test_missing_spans_15m_gap_spanning_midnight():
+    # 96 periods ending at 2020-01-02 12:00, missing 23:30 through 00:30.
+    end = datetime(2020, 1, 2, 12)
+    bits = np.ones(96, dtype=bool)
+    first = end - 96 * QUARTER
+    gap = datetime(2020, 1, 1, 23, 30)
+    start = (gap - first) // QUARTER
+    bits[start:start + 5] = False
+
+    spans = bitmap.missing_spans(bits, end, QUARTER, 96)
+    assert spans == [[gap, datetime(2020, 1, 2, 0, 30)]]
+
+
+def test_build_and_refresh():
+    config = {
+        "name": "QUARTER",
+        "period": "15m",
+        "out_dir": "/archive",
+        "out_path": "${name}/%Y/%j/${name}%j${session}%M.dat",
+    }
+    end = datetime(2020, 1, 1, 0, 30)
+    archived = {
+        "/archive/QUARTER/2019/365/QUARTER365x45.dat",
+        "/archive/QUARTER/2020/001/QUARTER001a15.dat",
+    }
+
+    bits = bitmap.build(config, archived.__contains__, end, 4)
+    assert bits.tolist() == [False, True, False, True]
+
+    archived.add("/archive/QUARTER/2020/001/QUARTER001a00.dat")
+    first = end - 4 * QUARTER
+    bitmap.refresh(config, archived.__contains__, first, bits, [2])
+    assert bits.tolist() == [False, True, True, True]
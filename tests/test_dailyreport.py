@@ -0,0 +1,91 @@
+import argparse
+import logging
+from datetime import datetime
+
+import pytest
+
+from filefetcher import dailyreport as dr
+
+
+def make_queues(loggers=3, files=20):
+    dataloggers = []
+    for i in range(loggers):
+        name = "LOGGER{}".format(i)
+        new_files = ["/archive/{}/{}.dat".format(name, n) for n in range(files)]
+        dataloggers.append(
+            {
+                "name": name,
+                "new_files": new_files,
+                "backfill": None,
+                "coverage": {
+                    "weekly": 50,
+                    "weekly_change": None,
+                    "monthly": 50,
+                    "yearly": 50,
+                    "ad_hoc": 0,
+                    "missing": [[datetime(2020, 1, 1), datetime(2020, 1, 2)]],
+                },
+            }
+        )
+    return [
+        {
+            "name": "queue",
+            "dataloggers": dataloggers,
+            "daily_total": loggers * files,
+            "weekly_coverage": 50,
+            "monthly_coverage": 50,
+            "yearly_coverage": 50,
+            "ad_hoc_coverage": 0,
+        }
+    ]
+
+
+@pytest.fixture(autouse=True)
+def report_args(monkeypatch):
+    monkeypatch.setattr(
+        dr, "logger", logging.getLogger("test_dailyreport"), raising=False
+    )
+    args = argparse.Namespace(
+        span=-1, compact=False, max_items=50, max_size=dr.DEFAULT_MAX_SIZE, attach=[]
+    )
+    monkeypatch.setattr(dr, "global_args", args, raising=False)
+
+
+def elements(html):
+    parsed = dr.OpenElements()
+    parsed.feed(html)
+    parsed.close()
+    return parsed
+
+
+def test_render_whole_report():
+    html = dr.render_report(make_queues(), dr.DEFAULT_MAX_SIZE)
+
+    assert "Report truncated" not in html
+    assert "LOGGER2/19.dat" in html
+    assert elements(html).stack == []
+
+
+def test_render_truncated_report():
+    whole = dr.render_report(make_queues(), dr.DEFAULT_MAX_SIZE)
+    max_size = len(whole) // 2
+
+    html = dr.render_report(make_queues(), max_size)
+
+    assert len(html) <= max_size
+    assert "Report truncated at" in html
+    assert "Recent missing files" not in html
+    assert html.rstrip().endswith("</body></html>")
+    assert elements(html).stack == []
+
+
+def test_render_truncated_report_keeps_head_and_summary():
+    html = dr.render_report(make_queues(), 100)
+
+    assert "<style>" in html
+    assert "<body>" in html
+    assert "LOGGER2" in html
+    assert "queue_name_cell" in html
+    assert "LOGGER0/0.dat" not in html
+    assert "Report truncated at" in html
+    assert elements(html).stack == []
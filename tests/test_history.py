@@ -0,0 +1,101 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from filefetcher.history import CoverageHistory
+
+DAILY = {
+    "name": "DAILY",
+    "out_dir": "/archive",
+    "out_path": "${name}/%Y/${name}%j.T00",
+}
+QUARTER = dict(DAILY, name="QUARTER", period="15m")
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = CoverageHistory(str(tmp_path / "history.db"))
+    yield history
+    history.close()
+
+
+def test_load_without_history(history):
+    bits, known = history.load(DAILY, datetime(2020, 1, 1), 10)
+    assert not bits.any()
+    assert not known.any()
+
+
+def test_store_and_load_across_years(history):
+    first = datetime(2019, 12, 25)
+    bits = np.arange(20) % 3 == 0
+    history.store(DAILY, first, bits)
+
+    loaded, known = history.load(DAILY, first, 20)
+    assert loaded.tolist() == bits.tolist()
+    assert known.all()
+
+
+def test_load_a_window_around_what_was_stored(history):
+    # 2020 is a leap year, so its bitmap is 366 bits and doesn't pack evenly.
+    first = datetime(2020, 12, 30)
+    history.store(DAILY, first, np.array([True, False, True, True]))
+
+    bits, known = history.load(DAILY, first - timedelta(2), 8)
+    assert bits.tolist() == [False, False, True, False, True, True, False, False]
+    assert known.tolist() == [False, False, True, True, True, True, False, False]
+
+
+def test_store_keeps_the_rest_of_the_year(history):
+    history.store(DAILY, datetime(2020, 3, 1), np.ones(5, dtype=bool))
+    history.store(DAILY, datetime(2020, 3, 4), np.zeros(5, dtype=bool))
+
+    bits, known = history.load(DAILY, datetime(2020, 3, 1), 8)
+    assert bits.tolist() == [True] * 3 + [False] * 5
+    assert known.all()
+
+
+def test_15m_periods_across_new_year(history):
+    first = datetime(2020, 12, 31, 23)
+    bits = np.array([True, False, True, False, False, True, True, False])
+    history.store(QUARTER, first, bits)
+
+    loaded, known = history.load(QUARTER, first, 8)
+    assert loaded.tolist() == bits.tolist()
+    assert known.all()
+
+
+def test_changed_out_path_forgets_history(history):
+    first = datetime(2020, 3, 1)
+    history.store(DAILY, first, np.ones(5, dtype=bool))
+
+    moved = dict(DAILY, out_path="${name}/${name}%Y%j.T00")
+    bits, known = history.load(moved, first, 5)
+    assert not bits.any()
+    assert not known.any()
+
+
+def test_weekly(history):
+    history.record_weekly(date(2020, 3, 1), "DAILY", 71.4)
+    history.record_weekly(date(2020, 3, 1), "DAILY", 85.7)
+
+    assert history.weekly(date(2020, 3, 1), "DAILY") == 85.7
+    assert history.weekly(date(2020, 3, 8), "DAILY") is None
+
+
+def test_fetches(history):
+    history.record_fetch("DAILY", "/archive/DAILY/b", fetch_time=100)
+    history.record_fetch("DAILY", "/archive/DAILY/a", fetch_time=200)
+    history.record_fetch("DAILY", "/archive/DAILY/a", fetch_time=300)
+    history.record_fetch("OTHER", "/archive/OTHER/c", fetch_time=300)
+
+    assert history.fetched_since(150) == {
+        "DAILY": ["/archive/DAILY/a"],
+        "OTHER": ["/archive/OTHER/c"],
+    }
+
+    history.forget_fetches(200)
+    assert history.fetched_since(0) == {
+        "DAILY": ["/archive/DAILY/a"],
+        "OTHER": ["/archive/OTHER/c"],
+    }
@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from filefetcher import period
+
+DAILY = {"name": "DAILY"}
+HOURLY = {"name": "HOURLY", "period": "1h"}
+QUARTER = {"name": "QUARTER", "period": "15m"}
+
+
+@pytest.mark.parametrize(
+    "text, length",
+    [
+        ("1d", timedelta(days=1)),
+        ("1h", timedelta(hours=1)),
+        ("15m", timedelta(minutes=15)),
+        (" 6h ", timedelta(hours=6)),
+    ],
+)
+def test_parse_period(text, length):
+    assert period.parse_period(text) == length
+
+
+@pytest.mark.parametrize("text", ["", "d", "1w", "1.5h", "fifteen m"])
+def test_parse_period_rejects_nonsense(text):
+    with pytest.raises(ValueError, match="Cannot understand"):
+        period.parse_period(text)
+
+
+@pytest.mark.parametrize("text", ["0h", "-1h", "2d", "7h", "25h", "7m"])
+def test_parse_period_rejects_uneven_periods(text):
+    with pytest.raises(ValueError, match="divide a day evenly"):
+        period.parse_period(text)
+
+
+def test_per_day():
+    assert period.per_day(DAILY) == 1
+    assert period.per_day(HOURLY) == 24
+    assert period.per_day(QUARTER) == 96
+
+
+@pytest.mark.parametrize(
+    "when, length, start",
+    [
+        (datetime(2020, 3, 1, 13, 7, 59), period.DAY, datetime(2020, 3, 1)),
+        (datetime(2020, 3, 1, 13, 7, 59), timedelta(hours=1), datetime(2020, 3, 1, 13)),
+        (
+            datetime(2020, 3, 1, 13, 7, 59),
+            timedelta(minutes=15),
+            datetime(2020, 3, 1, 13),
+        ),
+        (
+            datetime(2020, 3, 1, 23, 59, 59),
+            timedelta(minutes=15),
+            datetime(2020, 3, 1, 23, 45),
+        ),
+        (datetime(2020, 3, 2), timedelta(minutes=15), datetime(2020, 3, 2)),
+    ],
+)
+def test_floor(when, length, start):
+    assert period.floor(when, length) == start
+
+
+def test_last_complete():
+    now = datetime(2020, 3, 1, 13, 7)
+    assert period.last_complete(DAILY, now) == datetime(2020, 2, 29)
+    assert period.last_complete(HOURLY, now) == datetime(2020, 3, 1, 12)
+    assert period.last_complete(QUARTER, now) == datetime(2020, 3, 1, 12, 45)
+
+
+def test_last_complete_just_after_midnight():
+    now = datetime(2021, 1, 1, 0, 5)
+    assert period.last_complete(DAILY, now) == datetime(2020, 12, 31)
+    assert period.last_complete(HOURLY, now) == datetime(2020, 12, 31, 23)
+    assert period.last_complete(QUARTER, now) == datetime(2020, 12, 31, 23, 45)
+
+
+def test_expand_session_letters():
+    datalogger = dict(HOURLY, url="http://host/${name}%j${session}.T00")
+    assert (
+        period.expand(datalogger, "url", datetime(2020, 2, 3, 0))
+        == "http://host/HOURLY034a.T00"
+    )
+    assert (
+        period.expand(datalogger, "url", datetime(2020, 2, 3, 23))
+        == "http://host/HOURLY034x.T00"
+    )
+
+
+def test_expand_daily_session_is_zero():
+    datalogger = dict(DAILY, url="http://host/${name}%j${session}.T00")
+    assert (
+        period.expand(datalogger, "url", datetime(2020, 2, 3))
+        == "http://host/DAILY0340.T00"
+    )
+
+
+def test_expand_15m_session_is_the_hour():
+    datalogger = dict(QUARTER, out_path="${name}/%Y/%j/${name}%j${session}%M.%y_")
+    assert (
+        period.expand(datalogger, "out_path", datetime(2020, 2, 3, 1, 45))
+        == "QUARTER/2020/034/QUARTER034b45.20_"
+    )
+
+
+def test_compile_pattern_escapes_literal_text():
+    regex = period.compile_pattern("a.b+c/%Y%m%d.dat")
+    assert regex.fullmatch("a.b+c/20200203.dat")
+    assert not regex.fullmatch("aXb+c/20200203.dat")
+    assert not regex.fullmatch("a.b+c/20200203Xdat")
+
+
+def test_compile_pattern_percent():
+    regex = period.compile_pattern("100%%/%Y")
+    assert regex.fullmatch("100%/2020")
+
+
+def test_compile_pattern_rejects_unknown_directive():
+    with pytest.raises(ValueError, match="%a"):
+        period.compile_pattern("%Y%a")
+
+
+def test_compile_pattern_backreferences_repeated_directive():
+    regex = period.compile_pattern("%Y/%j/LOG%j.dat")
+    assert regex.fullmatch("2020/034/LOG034.dat")
+    assert not regex.fullmatch("2020/034/LOG035.dat")
+
+
+def test_compile_pattern_session():
+    regex = period.compile_pattern("LOG%j{}.dat".format(period.SESSION_MARK))
+    assert regex.fullmatch("LOG034a.dat").group("session") == "a"
+    assert regex.fullmatch("LOG0340.dat").group("session") == "0"
+    assert not regex.fullmatch("LOG034y.dat")
+
+
+@pytest.mark.parametrize(
+    "pattern, text, when",
+    [
+        ("%Y%m%d.dat", "20200229.dat", datetime(2020, 2, 29)),
+        ("%Y/%j/L%j.dat", "2020/366/L366.dat", datetime(2020, 12, 31)),
+        ("%Y%m%d%H%M", "202002031345", datetime(2020, 2, 3, 13, 45)),
+        ("L%j{}%M.%y_", "L034b45.20_", datetime(2020, 2, 3, 1, 45)),
+        ("L%j{}.%y_", "L0340.20_", datetime(2020, 2, 3)),
+    ],
+)
+def test_match_time(pattern, text, when):
+    regex = period.compile_pattern(pattern.format(period.SESSION_MARK))
+    assert period.match_time(regex, text) == when
+
+
+@pytest.mark.parametrize(
+    "text, year", [("L001.00", 2000), ("L001.68", 2068), ("L001.69", 1969)]
+)
+def test_match_time_two_digit_years(text, year):
+    regex = period.compile_pattern("L%j.%y")
+    assert period.match_time(regex, text) == datetime(year, 1, 1)
+
+
+def test_match_time_backreferenced_day_of_year():
+    regex = period.compile_pattern("%Y/%j/L%j.dat")
+    assert period.match_time(regex, "2020/034/L034.dat") == datetime(2020, 2, 3)
+    assert period.match_time(regex, "2020/034/L035.dat") is None
+
+
+@pytest.mark.parametrize(
+    "pattern, text",
+    [
+        ("%Y%m%d.dat", "20200230.dat"),
+        ("%Y%m%d.dat", "2020023.dat"),
+        ("%m%d.dat", "0203.dat"),
+        ("%Y%m.dat", "202002.dat"),
+    ],
+)
+def test_match_time_rejects(pattern, text):
+    assert period.match_time(period.compile_pattern(pattern), text) is None
+
+
+def test_path_regex_round_trips_expand():
+    datalogger = dict(
+        QUARTER, out_dir="/archive", out_path="${name}/%Y/%j/${name}%j${session}%M.%y_"
+    )
+    regex = period.path_regex(datalogger, "out_path")
+    start = datetime(2020, 12, 31, 23)
+    for i in range(8):
+        when = start + i * timedelta(minutes=15)
+        out_path = period.expand(datalogger, "out_path", when)
+        assert period.match_time(regex, out_path) == when
+
+
+def test_path_prefix():
+    datalogger = dict(HOURLY, out_path="${name}/%Y/%j/${name}%j${session}.dat")
+    assert period.path_prefix(datalogger, "out_path") == "HOURLY/"
+
+
+def test_expand_same_name_different_values():
+    a = {"name": "SAME", "address": "a.example", "url": "ftp://${address}/%Y"}
+    b = dict(a, address="b.example")
+    when = datetime(2020, 1, 1)
+
+    assert period.expand(a, "url", when) == "ftp://a.example/2020"
+    assert period.expand(b, "url", when) == "ftp://b.example/2020"
+
+
+def test_path_regex_same_name_different_values():
+    a = {"name": "SAME", "out_dir": "/a", "out_path": "${name}/${site}%Y.dat"}
+    b = dict(a, site="B")
+    a["site"] = "A"
+
+    assert period.path_regex(a, "out_path").fullmatch("SAME/A2020.dat")
+    assert not period.path_regex(b, "out_path").fullmatch("SAME/A2020.dat")
+    assert period.path_regex(b, "out_path").fullmatch("SAME/B2020.dat")
+
+
+def test_identifiers():
+    template = "${name}/$site/%Y/${name}%j${session}$$x"
+    assert period.identifiers(template) == ("name", "site")
@@ -0,0 +1,161 @@
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import tomputils.util as tutil
+
+import filefetcher.filefetcher as ff
+from filefetcher import period
+from filefetcher.transport import FakeHost, FakeTransport
+
+DAYS = 5
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setenv("FF_TMP_DIR", str(tmp_path / "tmp"))
+    monkeypatch.setenv("PYCURL_MINOR_ERRORS", "7,78")
+    monkeypatch.delenv("FF_SPOOL_DIR", raising=False)
+    monkeypatch.delenv("FF_REPORT_DB", raising=False)
+    os.makedirs(tmp_path / "tmp")
+
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    installed = today - timedelta(DAYS)
+    datalogger = {
+        "name": "TEST",
+        "address": "test.example.com",
+        "url": "ftp://${address}/${name}%Y%m%d.T00",
+        "out_dir": str(tmp_path / "out"),
+        "out_path": "${name}/%Y/${name}%j.T00",
+        "backfill": installed.strftime("%m/%d/%Y"),
+        "partial_downloads": True,
+    }
+
+    transport = FakeTransport(
+        default=FakeHost(latency=0, installed=installed), error_codes=[7]
+    )
+    # Both expect the logger main() would have set up.
+    logger = logging.getLogger("test")
+    monkeypatch.setattr(tutil, "logger", logger, raising=False)
+    monkeypatch.setattr(ff, "logger", logger, raising=False)
+    monkeypatch.setattr(ff, "args", argparse.Namespace(no_backfill=False))
+    monkeypatch.setattr(ff, "global_config", {}, raising=False)
+    monkeypatch.setattr(ff, "transport", transport)
+    return {"name": "test", "dataloggers": [datalogger]}, transport
+
+
+def archived(datalogger):
+    root = os.path.join(datalogger["out_dir"], datalogger["name"])
+    return sorted(
+        os.path.join(dir, file) for dir, _, files in os.walk(root) for file in files
+    )
+
+
+def expected(datalogger):
+    last = period.last_complete(datalogger)
+    paths = []
+    for i in range(DAYS):
+        out_path = period.expand(datalogger, "out_path", last - i * period.DAY)
+        paths.append(os.path.join(datalogger["out_dir"], out_path))
+    return sorted(paths)
+
+
+def test_fetches_back_to_backfill_date(queue):
+    config, transport = queue
+    datalogger = config["dataloggers"][0]
+
+    ff.poll_queue(config)
+
+    assert archived(datalogger) == expected(datalogger)
+    # One transfer per file, then one which finds nothing and stops the logger.
+    assert transport.transfers == DAYS + 1
+
+
+def test_keeps_going_past_missing_files_until_backfill_date(queue):
+    config, transport = queue
+    datalogger = config["dataloggers"][0]
+    backfill = period.parse_date(datalogger["backfill"]) - timedelta(3)
+    datalogger["backfill"] = backfill.strftime("%m/%d/%Y")
+
+    ff.poll_queue(config)
+
+    assert archived(datalogger) == expected(datalogger)
+    assert transport.transfers == DAYS + 3
+
+
+def test_stops_at_archived_file_once_backfill_is_done(queue):
+    config, transport = queue
+    datalogger = config["dataloggers"][0]
+    datalogger["backfill"] = datetime.utcnow().strftime("%m/%d/%Y")
+
+    ff.poll_queue(config)
+    transfers = transport.transfers
+    ff.poll_queue(config)
+
+    assert archived(datalogger) == expected(datalogger)
+    assert transport.transfers == transfers
+
+
+def test_disabled_logger_is_skipped(queue):
+    config, transport = queue
+    config["dataloggers"][0]["disabled"] = True
+
+    ff.poll_queue(config)
+
+    assert transport.transfers == 0
+    assert archived(config["dataloggers"][0]) == []
+
+
+@pytest.mark.parametrize(
+    "out_path, out_file",
+    [
+        ("${name}/%Y/${name}%j.T00", "TEST/2020/TEST034.T00"),
+        ("${name}/%Y/%b/%d.T00", "TEST/2020/Feb/03.T00"),
+    ],
+)
+def test_find_datalogger(out_path, out_file):
+    other = {"name": "OTHER", "out_dir": "/archive", "out_path": "%Y/%b/%d.T00"}
+    datalogger = {"name": "TEST", "out_dir": "/archive", "out_path": out_path}
+    dataloggers = [other, datalogger]
+
+    assert ff.find_datalogger(dataloggers, "/archive/" + out_file) is datalogger
+    assert ff.find_datalogger(dataloggers, "/elsewhere/" + out_file) is None
+
+
+def test_recovers_spool_with_unsupported_directive(queue, tmp_path, monkeypatch):
+    config, transport = queue
+    datalogger = config["dataloggers"][0]
+    datalogger["out_path"] = "${name}/%Y/%b/%d.T00"
+    spool_dir = tmp_path / "spool"
+    monkeypatch.setenv("FF_SPOOL_DIR", str(spool_dir))
+
+    out_file = os.path.join(datalogger["out_dir"], "TEST", "2020", "Feb", "03.T00")
+    spool_file = spool_dir / config["name"] / out_file.lstrip(os.sep)
+    os.makedirs(spool_file.parent)
+    spool_file.write_text("left over")
+
+    ff.poll_queue(config)
+
+    assert not spool_file.exists()
+    with open(out_file) as f:
+        assert f.read() == "left over"
+    assert transport.transfers == DAYS + 1
+
+
+def test_records_fetches_for_the_report(queue, tmp_path, monkeypatch):
+    from filefetcher.history import CoverageHistory
+
+    config, transport = queue
+    datalogger = config["dataloggers"][0]
+    history_db = str(tmp_path / "history.db")
+    monkeypatch.setenv("FF_REPORT_DB", history_db)
+
+    ff.poll_queue(config)
+
+    history = CoverageHistory(history_db)
+    try:
+        assert history.fetched_since(0) == {"TEST": expected(datalogger)}
+    finally:
+        history.close()
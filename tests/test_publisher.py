@@ -0,0 +1,122 @@
+import errno
+import os
+
+import pytest
+
+from filefetcher import publisher
+
+
+@pytest.fixture(autouse=True)
+def no_delay(monkeypatch):
+    monkeypatch.setattr(publisher, "RETRY_DELAY", 0)
+    monkeypatch.setattr(publisher, "made_dirs", set())
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / "spool")
+
+
+def failing_rename(monkeypatch, out_file, errors):
+    """Make renames onto out_file raise each of errors in turn."""
+    rename = os.rename
+    errors = list(errors)
+
+    def fake_rename(src, dst):
+        if str(dst) == str(out_file) and errors:
+            error = errors.pop(0)
+            raise OSError(error, os.strerror(error))
+        rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", fake_rename)
+
+
+def make_file(path, text="data"):
+    with open(str(path), "w") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(str(path)) as f:
+        return f.read()
+
+
+def test_submit(tmp_path, spool):
+    tmp_file = tmp_path / "x.tmp"
+    make_file(tmp_file)
+    out_file = tmp_path / "archive" / "A" / "x.dat"
+    published = []
+
+    pub = publisher.Publisher(spool)
+    pub.submit(tmp_file, out_file, published.append)
+    pub.close()
+
+    assert read(out_file) == "data"
+    assert published == [str(out_file)]
+    assert not pub.is_pending(out_file)
+    assert not os.path.exists(pub.spool_path(out_file))
+
+
+def test_copies_across_filesystems(tmp_path, spool, monkeypatch):
+    tmp_file = tmp_path / "x.tmp"
+    make_file(tmp_file)
+    out_file = tmp_path / "archive" / "x.dat"
+    failing_rename(monkeypatch, out_file, [errno.EXDEV])
+
+    pub = publisher.Publisher(spool)
+    pub.submit(tmp_file, out_file)
+    pub.close()
+
+    assert read(out_file) == "data"
+    assert not os.path.exists("{}.part".format(out_file))
+    assert not os.path.exists(pub.spool_path(out_file))
+
+
+def test_retries(tmp_path, spool, monkeypatch):
+    tmp_file = tmp_path / "x.tmp"
+    make_file(tmp_file)
+    out_file = tmp_path / "archive" / "x.dat"
+    failing_rename(monkeypatch, out_file, [errno.EIO, errno.EIO])
+    published = []
+
+    pub = publisher.Publisher(spool, retries=2)
+    pub.submit(tmp_file, out_file, published.append)
+    pub.close()
+
+    assert read(out_file) == "data"
+    assert published == [str(out_file)]
+
+
+def test_gives_up_and_leaves_file_in_spool(tmp_path, spool, monkeypatch):
+    tmp_file = tmp_path / "x.tmp"
+    make_file(tmp_file)
+    out_file = tmp_path / "archive" / "x.dat"
+    failing_rename(monkeypatch, out_file, [errno.EIO] * 3)
+    published = []
+
+    pub = publisher.Publisher(spool, retries=2)
+    pub.submit(tmp_file, out_file, published.append)
+    pub.close()
+
+    assert not os.path.exists(str(out_file))
+    assert read(pub.spool_path(out_file)) == "data"
+    assert published == []
+    assert not pub.is_pending(out_file)
+
+
+def test_recover(tmp_path, spool):
+    out_a = tmp_path / "archive" / "A" / "a.dat"
+    out_b = tmp_path / "archive" / "B" / "b.dat"
+    for out_file in (out_a, out_b):
+        spool_file = os.path.join(spool, str(out_file).lstrip(os.sep))
+        os.makedirs(os.path.dirname(spool_file))
+        make_file(spool_file, out_file.name)
+    published = []
+
+    pub = publisher.Publisher(spool)
+    pub.recover(lambda out_file: published.append if "/A/" in out_file else None)
+    pub.close()
+
+    assert read(out_a) == "a.dat"
+    assert read(out_b) == "b.dat"
+    assert published == [str(out_a)]
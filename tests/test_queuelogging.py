@@ -0,0 +1,42 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from filefetcher import queuelogging
+
+
+@pytest.fixture
+def records():
+    records = queue.Queue()
+    log = logging.getLogger("test_queuelogging")
+    log.propagate = False
+    handler = queuelogging.QueueHandler(records)
+    handler.addFilter(queuelogging.QueueNameFilter())
+    log.addHandler(handler)
+    queuelogging.set_queue_name("q1")
+    try:
+        try:
+            raise RuntimeError("boom")
+        except RuntimeError:
+            log.exception("Cannot fetch %s", "x.dat")
+        yield records
+    finally:
+        log.removeHandler(handler)
+        queuelogging.set_queue_name(None)
+
+
+def test_json_keeps_exception_apart_from_message(records):
+    entry = json.loads(queuelogging.JsonFormatter().format(records.get_nowait()))
+
+    assert entry["message"] == "Cannot fetch x.dat"
+    assert entry["queue"] == "q1"
+    assert "RuntimeError: boom" in entry["exception"]
+
+
+def test_text_still_includes_traceback(records):
+    text = logging.Formatter(queuelogging.TEXT_FORMAT).format(records.get_nowait())
+
+    assert "Cannot fetch x.dat" in text
+    assert "RuntimeError: boom" in text
@@ -0,0 +1,72 @@
+from datetime import time
+
+import pytest
+
+from filefetcher.transport import Transport, parse_listing, recv_speed
+
+SCHEDULE = {
+    "recvSpeed": 1000,
+    "recvSchedule": [
+        {"start": "22:00", "end": "06:00", "speed": 0},
+        {"start": "08:00", "end": "17:00", "speed": 200},
+    ],
+}
+
+
+@pytest.mark.parametrize(
+    "now, speed",
+    [
+        (time(22, 0), 0),
+        (time(23, 59), 0),
+        (time(0, 0), 0),
+        (time(5, 59), 0),
+        (time(6, 0), 1000),
+        (time(8, 0), 200),
+        (time(16, 59), 200),
+        (time(17, 0), 1000),
+        (time(21, 59), 1000),
+    ],
+)
+def test_recv_speed_schedule_spanning_midnight(now, speed):
+    assert recv_speed(SCHEDULE, now) == speed
+
+
+def test_recv_speed_entry_without_times_always_matches():
+    datalogger = {"recvSpeed": 1000, "recvSchedule": [{"speed": 50}]}
+    assert recv_speed(datalogger, time(12, 0)) == 50
+
+
+def test_recv_speed_without_schedule():
+    assert recv_speed({"recvSpeed": 1000}, time(12, 0)) == 1000
+    assert recv_speed({}, time(12, 0)) == 0
+
+
+def test_parse_listing():
+    listing = "\n".join(
+        [
+            "-rw-r--r--   1 gps  gps   1024 Jan 02 03:04 LOG0020.T00",
+            "drwxr-xr-x   2 gps  gps   4096 Jan 02 03:04 sub",
+            "01-02-20  03:04AM              2048 LOG0030.T00",
+            "01-02-20  03:04AM       <DIR>          other",
+        ]
+    )
+    assert parse_listing(listing) == {"LOG0020.T00": 1024, "LOG0030.T00": 2048}
+
+
+def test_parse_listing_keeps_spaces_in_names():
+    listing = "-rw-r--r--   1 gps  gps   512 Jan 02 03:04 LOG 0020.T00"
+    assert parse_listing(listing) == {"LOG 0020.T00": 512}
+
+
+def test_transport_must_implement_interface():
+    class FetchOnly(Transport):
+        def fetch(self, datalogger, url, out, offset=0, resume=True):
+            pass
+
+    class Complete(FetchOnly):
+        def sizes(self, datalogger, urls):
+            return {}
+
+    with pytest.raises(TypeError, match="sizes"):
+        FetchOnly()
+    assert Complete().sizes({}, []) == {}
@@ -0,0 +1,157 @@
+import logging
+import os
+import sys
+
+import pytest
+
+from filefetcher import archivescan
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "support"))
+import urltooutpath  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def script_logger(monkeypatch):
+    monkeypatch.setattr(
+        urltooutpath, "logger", logging.getLogger("test_urltooutpath"), raising=False
+    )
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+
+
+def make_datalogger(out_dir, **kwargs):
+    datalogger = {
+        "name": "LOG",
+        "url": "ftp://host/${name}%j0.%y_",
+        "out_dir": out_dir,
+        "out_path": "${name}/%Y/${name}%j0.%y_",
+    }
+    datalogger.update(kwargs)
+    return datalogger
+
+
+def test_find_conflicts():
+    snapshot = archivescan.Snapshot({"/a/taken": 1})
+    moves = [
+        ("/a/1", "/a/new1"),
+        ("/a/2", "/a/taken"),
+        ("/a/3", "/a/shared"),
+        ("/a/4", "/a/shared"),
+    ]
+
+    safe, conflicts = urltooutpath.find_conflicts(moves, snapshot)
+
+    assert safe == [("/a/1", "/a/new1")]
+    assert conflicts == [
+        ("/a/2", "/a/taken", "destination exists"),
+        ("/a/3", "/a/shared", "destination shared"),
+        ("/a/4", "/a/shared", "destination shared"),
+    ]
+
+
+def test_make_plan_by_url_file_name(tmp_path):
+    out_dir = str(tmp_path)
+    touch(os.path.join(out_dir, "LOG", "LOG0340.20_"))
+    touch(os.path.join(out_dir, "LOG", "old", "LOG0350.20_"))
+    touch(os.path.join(out_dir, "LOG", "2020", "LOG0360.20_"))
+    touch(os.path.join(out_dir, "LOG", "notes.txt"))
+    # Already in place, so it blocks the move from 2021.
+    touch(os.path.join(out_dir, "LOG", "2021", "LOG0370.20_"))
+    touch(os.path.join(out_dir, "LOG", "2020", "LOG0370.20_"))
+
+    datalogger = make_datalogger(out_dir)
+    moves, conflicts = urltooutpath.make_plan([datalogger], workers=2)
+
+    assert sorted(moves) == [
+        (
+            os.path.join(out_dir, "LOG", "LOG0340.20_"),
+            os.path.join(out_dir, "LOG", "2020", "LOG0340.20_"),
+        ),
+        (
+            os.path.join(out_dir, "LOG", "old", "LOG0350.20_"),
+            os.path.join(out_dir, "LOG", "2020", "LOG0350.20_"),
+        ),
+    ]
+    assert conflicts == [
+        (
+            os.path.join(out_dir, "LOG", "2021", "LOG0370.20_"),
+            os.path.join(out_dir, "LOG", "2020", "LOG0370.20_"),
+            "destination exists",
+        )
+    ]
+
+
+def test_make_plan_from_old_out_path(tmp_path):
+    out_dir = str(tmp_path)
+    touch(os.path.join(out_dir, "OLD", "2020", "LOG0340.20_"))
+    touch(os.path.join(out_dir, "OLD", "2020", "LOG0350.20_"))
+    touch(os.path.join(out_dir, "LOG", "2020", "LOG0350.20_"))
+
+    datalogger = make_datalogger(out_dir, old_out_path="OLD/%Y/${name}%j0.%y_")
+    moves, conflicts = urltooutpath.make_plan([datalogger], workers=2)
+
+    assert moves == [
+        (
+            os.path.join(out_dir, "OLD", "2020", "LOG0340.20_"),
+            os.path.join(out_dir, "LOG", "2020", "LOG0340.20_"),
+        )
+    ]
+    assert [reason for old_path, new_path, reason in conflicts] == [
+        "destination exists"
+    ]
+
+
+def test_make_plan_skips_unusable_patterns(tmp_path):
+    out_dir = str(tmp_path)
+    touch(os.path.join(out_dir, "LOG", "LOG0340.20_"))
+    touch(os.path.join(out_dir, "BAD", "BADJan.20_"))
+
+    loggers = [
+        make_datalogger(out_dir, name="BAD", url="ftp://host/${name}%b.%y_"),
+        make_datalogger(out_dir),
+    ]
+    moves, conflicts = urltooutpath.make_plan(loggers, workers=2)
+
+    assert [old_path for old_path, new_path in moves] == [
+        os.path.join(out_dir, "LOG", "LOG0340.20_")
+    ]
+    assert conflicts == []
+
+
+def test_journal(tmp_path):
+    journal = urltooutpath.Journal(str(tmp_path / "journal"))
+    assert journal.done() == set()
+
+    journal.record("/a/1", "/b/1")
+    journal.record("/a/2", "/b/2")
+    journal.close()
+
+    assert urltooutpath.Journal(journal.path).done() == {"/a/1", "/a/2"}
+
+
+def test_run_plan(tmp_path):
+    old_path = str(tmp_path / "old" / "x")
+    new_path = str(tmp_path / "new" / "x")
+    touch(old_path)
+    journal = urltooutpath.Journal(str(tmp_path / "journal"))
+
+    moves = [(old_path, new_path), (str(tmp_path / "missing"), new_path + "2")]
+    failures = urltooutpath.run_plan(moves, journal, workers=2)
+    journal.close()
+
+    assert failures == 1
+    assert os.path.exists(new_path)
+    assert journal.done() == {old_path}
+
+
+def test_snapshot_new_files():
+    snapshot = archivescan.Snapshot(
+        {"/a/LOG/1": 10, "/a/LOG/2/3": 30, "/a/LOG-2/4": 40, "/a/LOGS": 50}
+    )
+
+    assert snapshot.new_files("/a/LOG") == ["/a/LOG/1", "/a/LOG/2/3"]
+    assert snapshot.new_files("/a/LOG/", since=20) == ["/a/LOG/2/3"]
+    assert snapshot.new_files("/a/NONE") == []